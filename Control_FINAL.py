@@ -2,10 +2,11 @@ import gradio as gr
 import datetime
 import base64
 import time
+from modularization.chatbot.session_manager import SessionManager
 
 # === Work from here============
-# Global storage for saved chat sessions
-chat_sessions = {}
+# Saved chat sessions (SQLite, survives restarts; same dict-style access as before)
+chat_sessions = SessionManager()
 
 with open("W3_Nobg.png", "rb") as img_file:
     base64_str = base64.b64encode(img_file.read()).decode()
@@ -101,6 +102,16 @@ def load_chat(selected_index_str, session_list):
     
     return []  # Return empty if invalid selection
 
+# ---------------------------------------------
+# Restore the sidebar from the saved sessions
+# ---------------------------------------------
+def restore_sessions():
+    # Newest on top, under the fresh "New Chat"
+    saved = [name for name in reversed(list(chat_sessions)) if name != "New Chat"]
+    session_list = ["New Chat"] + saved
+    print("[DEBUG] restore_sessions() restored", len(saved), "saved sessions")
+    return [{"role": "assistant", "content": "👋 Welcome to W3 BrainBot!"}], session_list, create_session_html(session_list)
+
 # ---------------------------------------------
 # Build HTML for sessions (sidebar list)
 # ---------------------------------------------
@@ -766,7 +777,7 @@ html, body {
 
             # -- On initial load, show a welcome
             demo.load(
-                lambda: ([{"role": "assistant", "content": "👋 Welcome to W3 BrainBot!"}], ["New Chat"], create_session_html(["New Chat"])),
+                restore_sessions,
                 outputs=[chatbot, session_list, session_html]
             ).then(
                 lambda: gr.update(interactive=False),  # ✅ Disable "New Chat" button at startup
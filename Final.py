@@ -1,11 +1,17 @@
 import gradio as gr
 import datetime
-from sentence_transformers import SentenceTransformer
 import base64
+from html import escape as html_escape
+from modularization.chatbot.message_log import MessageLog
+from modularization.chatbot.session_manager import ShardedSessionStore, request_owner, OWNER_COOKIE_JS
 
 # === Work from here============
-# Global storage for saved chat sessions
-chat_sessions = {}
+# Saved chat sessions (SQLite, survives restarts), one partition per user / browser (see request_owner).
+# SESSION_SHARDS independent stores, so different users' handlers don't share a lock.
+SESSION_SHARDS = 8
+chat_sessions = ShardedSessionStore(shards=SESSION_SHARDS)
+# Messages sent when a saved chat is opened, and per "load earlier" click
+HISTORY_PAGE_SIZE = 50
 
 with open("W3_Nobg.png", "rb") as img_file:
     base64_str = base64.b64encode(img_file.read()).decode()
@@ -20,11 +26,15 @@ markdown_content = f"""
 def generate_chat_name():
     return datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
+# The requesting user's (or browser's) partition of the session store
+def sessions_for(request):
+    return chat_sessions.for_owner(request_owner(request))
+
 # -------------------------------
 # Chatbot response function
 # (handles multimodal input too)
 # -------------------------------
-def chatbot_response(user_input, chat_history):
+def chatbot_response(user_input, chat_history, sessions=None):
     print("[DEBUG] chatbot_response() called with user_input=", user_input)
 
     if isinstance(user_input, dict):  # e.g., user uploaded a file
@@ -34,38 +44,40 @@ def chatbot_response(user_input, chat_history):
 
     if not user_text:
         print("[DEBUG] Empty user input. Ignoring.")
-        return chat_history, ""  # Ignore empty messages
+        return chat_history.messages, ""  # Ignore empty messages
 
     # Generate bot response
     bot_reply = f"You asked: '{user_text}'"
 
-    # Append user message first
-    updated_history = list(chat_history)
-    updated_history.append({"role": "user", "content": user_text})
-
     # ✅ Force non-empty bot response (prevents flickering)
     if not bot_reply.strip():
         bot_reply = " "
 
-    # Append bot message (ensures there's always content)
-    updated_history.append({"role": "assistant", "content": bot_reply})
+    # Append the user message and the bot message to the log (two records, no history copy)
+    sessions = sessions or sessions_for(None)
+    chat_history.append(
+        sessions, lambda: sessions.create_session(generate_chat_name()),
+        {"role": "user", "content": user_text},
+        {"role": "assistant", "content": bot_reply},  # ensures there's always content
+    )
 
-    return updated_history, ""  # ✅ Ensures no flickering
+    return chat_history.messages, ""  # ✅ Ensures no flickering
 
 # -------------------------------------------
 # Start a new chat, optionally save old one
 # -------------------------------------------
-def start_new_chat(chat_history, session_list):
+def start_new_chat(chat_history, session_list, request: gr.Request = None):
     print("[DEBUG] start_new_chat() triggered")
     
-    if chat_history:
-        # Save previous session if not empty
-        chat_name = generate_chat_name()
-        chat_sessions[chat_name] = list(chat_history)
-        session_list = list(session_list)
-        session_list.append(chat_name)
+    if chat_history and chat_history.session_id:
+        # The session's messages are already stored turn by turn; just list it
+        session_id = chat_history.session_id
+        chat_name = session_list.get(session_id) or sessions_for(request).get_name(session_id) or session_id
+        if session_id not in session_list:
+            session_list = dict(session_list)
+            session_list[session_id] = chat_name
 
-        print("[DEBUG] Saved session as:", chat_name, "with", len(chat_history), "messages")
+        print("[DEBUG] Saved session", session_id, "as:", chat_name, "with", len(chat_history), "messages")
 
     welcome_message = f"🔄 New chat started!"
     
@@ -75,85 +87,99 @@ def start_new_chat(chat_history, session_list):
     # Fresh chat: assistant greeting
     new_chat = [{"role": "assistant", "content": welcome_message}]
     
-    # Return new chat, cleared chat_history, updated session_list, updated HTML
-    return new_chat, [], session_list, session_html
+    # Return new chat, a fresh log, updated session_list, updated HTML, nothing earlier to load
+    return new_chat, MessageLog(new_chat), session_list, session_html, gr.update(visible=False)
 
 # ---------------------------------------------
-# Load a past chat by index from 'session_list'
+# Load a past chat by its session id
 # ---------------------------------------------
-def load_chat(selected_index_str, session_list):
-    print("[DEBUG] load_chat() triggered with selected_index_str=", selected_index_str)
+def load_chat(session_id, request: gr.Request = None):
+    print("[DEBUG] load_chat() triggered with session_id=", session_id)
     
-    try:
-        idx = int(selected_index_str)
-        if 0 <= idx < len(session_list):
-            chat_name = session_list[idx]
-            print("[DEBUG] Loading chat_name =", chat_name)
-            if chat_name in chat_sessions:
-                return chat_sessions[chat_name]
-    except (ValueError, TypeError):
-        print("[DEBUG] Invalid index or parse error.")
+    if session_id:
+        sessions = sessions_for(request)
+        page = sessions.get_page(session_id, limit=HISTORY_PAGE_SIZE)
+        if page is not None:
+            # Only the latest page is sent; earlier pages on request
+            messages, start = page
+            log = MessageLog(
+                messages, session_id=session_id, offset=start, user_turns=sessions.get_user_turns(session_id)
+            )
+            return messages, log, gr.update(visible=start > 0)
     
-    return []  # Return empty if invalid selection
+    return [], MessageLog(), gr.update(visible=False)  # Return empty if invalid selection
+
+# Prepend the page before the earliest loaded message (cursor: the log's offset)
+def load_earlier(chat_history, request: gr.Request = None):
+    if not isinstance(chat_history, MessageLog) or not chat_history.session_id or not chat_history.offset:
+        return gr.update(), chat_history, gr.update(visible=False)
+    page = sessions_for(request).get_page(chat_history.session_id, before=chat_history.offset, limit=HISTORY_PAGE_SIZE)
+    if page is None:
+        return gr.update(), chat_history, gr.update(visible=False)
+    chat_history.prepend(page[0])
+    return chat_history.messages, chat_history, gr.update(visible=chat_history.offset > 0)
+
+# ---------------------------------------------
+# Saved sessions from the store, for the sidebar
+# ---------------------------------------------
+def restore_sessions(request: gr.Request = None):
+    sessions = sessions_for(request).session_names()
+    print("[DEBUG] restore_sessions() found", len(sessions), "saved sessions")
+    return sessions, create_session_html(sessions)
+
+# Greeting shown on page load; also the start of the first log
+def welcome():
+    messages = [{"role": "assistant", "content": "👋 Welcome to W3 BrainBot!"}]
+    return messages, MessageLog(messages)
 
 # ----------------------------------------------
 # Delete a chat session
 # ----------------------------------------------
-def delete_chat(session_index_str, session_list):
-    print("[DEBUG] delete_chat() triggered with session_index_str=", session_index_str)
+def delete_chat(session_id, session_list, request: gr.Request = None):
+    print("[DEBUG] delete_chat() triggered with session_id=", session_id)
     
-    try:
-        idx = int(session_index_str)
-        if 0 <= idx < len(session_list):
-            chat_name = session_list[idx]
-            print("[DEBUG] Deleting chat_name =", chat_name)
-            
-            # Remove from storage
-            if chat_name in chat_sessions:
-                del chat_sessions[chat_name]
-            
-            # Remove from list
-            new_session_list = list(session_list)
-            new_session_list.pop(idx)
-            
-            # Update HTML
-            session_html = create_session_html(new_session_list)
-            
-            return new_session_list, session_html
-    except (ValueError, TypeError):
-        print("[DEBUG] Invalid index or parse error.")
+    if session_id in session_list:
+        print("[DEBUG] Deleting chat_name =", session_list[session_id])
+        
+        # Remove from storage (only this user's partition)
+        sessions_for(request).delete_session(session_id)
+        
+        # Remove from list
+        new_session_list = dict(session_list)
+        del new_session_list[session_id]
+        
+        # Update HTML
+        session_html = create_session_html(new_session_list)
+        
+        return new_session_list, session_html
     
     return session_list, create_session_html(session_list)  # Return unchanged if error
 
 # ----------------------------------------------
 # Rename a chat session
 # ----------------------------------------------
-def rename_chat(data, session_list):
+def rename_chat(data, session_list, request: gr.Request = None):
     print("[DEBUG] rename_chat() triggered with data=", data)
     
     try:
-        # Parse data in format "index:new_name"
-        idx_str, new_name = data.split(":", 1)
-        idx = int(idx_str)
+        # Parse data in format "session_id:new_name"
+        session_id, new_name = data.split(":", 1)
         
-        if 0 <= idx < len(session_list):
-            old_name = session_list[idx]
-            print(f"[DEBUG] Renaming chat from '{old_name}' to '{new_name}'")
+        if session_id in session_list:
+            print(f"[DEBUG] Renaming chat from '{session_list[session_id]}' to '{new_name}'")
             
-            # Update in storage by creating new entry and deleting old one
-            if old_name in chat_sessions:
-                chat_sessions[new_name] = chat_sessions[old_name]
-                del chat_sessions[old_name]
+            # Update in storage (one row; the id and messages stay put)
+            sessions_for(request).rename_session(session_id, new_name)
             
             # Update in list
-            new_session_list = list(session_list)
-            new_session_list[idx] = new_name
+            new_session_list = dict(session_list)
+            new_session_list[session_id] = new_name
             
             # Update HTML
             session_html = create_session_html(new_session_list)
             
             return new_session_list, session_html
-    except (ValueError, TypeError, IndexError) as e:
+    except (ValueError, AttributeError) as e:
         print("[DEBUG] Error in rename_chat:", e)
     
     return session_list, create_session_html(session_list)  # Return unchanged if error
@@ -168,14 +194,15 @@ def create_session_html(sessions):
         return "<div class='session-list'></div>"
     
     html = "<div class='session-list'>"
-    for i, session in enumerate(sessions):
+    for session_id, name in sessions.items():
+        session_id = html_escape(session_id)
         html += f"""
-        <div class='session-item' data-index='{i}'>
-            <div class='session-name'>{session}</div>
-            <div class='session-options-button' data-index='{i}'>⋮</div>
-            <div class='options-menu' id='options-menu-{i}'>
-                <div class='option rename-option' data-index='{i}'>Rename</div>
-                <div class='option delete-option' data-index='{i}'>Delete</div>
+        <div class='session-item' data-session-id='{session_id}'>
+            <div class='session-name'>{html_escape(name)}</div>
+            <div class='session-options-button' data-session-id='{session_id}'>⋮</div>
+            <div class='options-menu' id='options-menu-{session_id}'>
+                <div class='option rename-option' data-session-id='{session_id}'>Rename</div>
+                <div class='option delete-option' data-session-id='{session_id}'>Delete</div>
             </div>
         </div>
         """
@@ -284,12 +311,12 @@ document.addEventListener("click", function(e){
   // Handle session item clicks for loading chats
   var item = e.target.closest(".session-item");
   if (item && !e.target.closest(".session-options-button") && !e.target.closest(".options-menu")) {
-    console.log("[DEBUG] Clicked .session-item with index:", item.dataset.index);
+    console.log("[DEBUG] Clicked .session-item with id:", item.dataset.sessionId);
 
     // We select the actual <textarea> inside #session-select-callback
     var hiddenBox = document.querySelector("#session-select-callback textarea");
     if (hiddenBox) {
-      hiddenBox.value = item.dataset.index;
+      hiddenBox.value = item.dataset.sessionId;
       console.log("[DEBUG] Setting hidden callback value:", hiddenBox.value);
       // Dispatch 'input' event to match .input(...) in Python
       hiddenBox.dispatchEvent(new Event("input", { bubbles: true }));
@@ -317,16 +344,16 @@ document.addEventListener("click", function(e){
     
     // Then open this one
     var optionsBtn = e.target.closest(".session-options-button");
-    var index = optionsBtn.dataset.index;
-    var menu = document.getElementById('options-menu-' + index);
+    var sessionId = optionsBtn.dataset.sessionId;
+    var menu = document.getElementById('options-menu-' + sessionId);
     menu.classList.toggle('active');
   }
   
   // Handle rename option
   if (e.target.closest(".rename-option")) {
     e.stopPropagation();
-    var index = e.target.closest(".rename-option").dataset.index;
-    var sessionItem = document.querySelector(`.session-item[data-index="${index}"]`);
+    var sessionId = e.target.closest(".rename-option").dataset.sessionId;
+    var sessionItem = document.querySelector(`.session-item[data-session-id="${sessionId}"]`);
     var sessionName = sessionItem.querySelector(".session-name").textContent;
     
     // Create rename input UI
@@ -350,16 +377,16 @@ document.addEventListener("click", function(e){
     renameUI.querySelector('.rename-confirm').addEventListener('click', function() {
       var newName = input.value.trim();
       if (newName) {
-        // Call rename_callback with "index:new_name" format
+        // Call rename_callback with "session_id:new_name" format
         var hiddenBox = document.querySelector("#rename-callback textarea");
         if (hiddenBox) {
-          hiddenBox.value = index + ":" + newName;
+          hiddenBox.value = sessionId + ":" + newName;
           hiddenBox.dispatchEvent(new Event("input", { bubbles: true }));
         }
       }
       
       // Close the menu
-      document.getElementById('options-menu-' + index).classList.remove('active');
+      document.getElementById('options-menu-' + sessionId).classList.remove('active');
     });
     
     // Setup input Enter key
@@ -370,25 +397,25 @@ document.addEventListener("click", function(e){
     });
     
     // Close the menu
-    document.getElementById('options-menu-' + index).classList.remove('active');
+    document.getElementById('options-menu-' + sessionId).classList.remove('active');
   }
   
   // Handle delete option
   if (e.target.closest(".delete-option")) {
     e.stopPropagation();
-    var index = e.target.closest(".delete-option").dataset.index;
+    var sessionId = e.target.closest(".delete-option").dataset.sessionId;
     
     if (confirm("Are you sure you want to delete this chat?")) {
       // Call delete_callback
       var hiddenBox = document.querySelector("#delete-callback textarea");
       if (hiddenBox) {
-        hiddenBox.value = index;
+        hiddenBox.value = sessionId;
         hiddenBox.dispatchEvent(new Event("input", { bubbles: true }));
       }
     }
     
     // Close the menu
-    document.getElementById('options-menu-' + index).classList.remove('active');
+    document.getElementById('options-menu-' + sessionId).classList.remove('active');
   }
 });
 </script>
@@ -398,7 +425,7 @@ document.addEventListener("click", function(e){
 #    Gradio UI Setup with Blocks
 # =============================================
 with gr.Blocks(
-    head=custom_js,
+    head=OWNER_COOKIE_JS + custom_js,
     theme=gr.themes.Base(primary_hue="blue", neutral_hue="gray", text_size=gr.themes.sizes.text_md),
     css="""
 
@@ -725,7 +752,7 @@ html, body {
             gr.Markdown(markdown_content)
 
             new_chat_btn = gr.Button("➕  New Chat", elem_classes=["new-chat-btn", "spaced-icon-btn"])
-            session_list = gr.State([])  
+            session_list = gr.State({})  # session id -> display name
             session_html = gr.HTML("<div class='session-list'></div>")
             
             # Hidden textbox for session selection
@@ -751,6 +778,9 @@ html, body {
 
         # -------------- Main Chat UI --------------
         with gr.Column(min_width=1100,scale=30, elem_classes=["main-chat-ui"]):
+            # Shown while a reopened chat has stored messages older than the loaded ones
+            load_earlier_btn = gr.Button("⬆ Load earlier messages", visible=False, size="sm")
+
             chatbot = gr.Chatbot(
                 show_label=False,
                 type="messages",
@@ -772,42 +802,44 @@ html, body {
                     max_lines=8000,
                 )
 
-            chat_history = gr.State([])
+            # Append-only MessageLog (see chatbot.message_log); never round-tripped through the client
+            chat_history = gr.State(None)
 
             # --- Send message handler ---
-            def handle_message(user_input, history):
+            def handle_message(user_input, history, request: gr.Request):
                 print("[DEBUG] handle_message triggered.")
-                new_history, _ = chatbot_response(user_input, history)
-                return new_history, ""
+                if not isinstance(history, MessageLog):
+                    history = MessageLog(list(history or []))
+                new_history, _ = chatbot_response(user_input, history, sessions_for(request))
+                return new_history, "", history
 
             # -- Pressing Enter in the message_input
             message_input.submit(
                 handle_message,
                 inputs=[message_input, chat_history],
-                outputs=[chatbot, message_input]
-            ).then(
-                lambda x: x,
-                inputs=[chatbot],
-                outputs=[chat_history]
+                outputs=[chatbot, message_input, chat_history]
             )
 
             # -- "New Chat" button
             new_chat_btn.click(
                 start_new_chat,
                 inputs=[chat_history, session_list],
-                outputs=[chatbot, chat_history, session_list, session_html]
+                outputs=[chatbot, chat_history, session_list, session_html, load_earlier_btn]
             )
 
             # -- Loading a past session
             #   session_select_callback is triggered by JS dispatchEvent("input")
             session_select_callback.input(
                 load_chat,
-                inputs=[session_select_callback, session_list],
-                outputs=[chatbot]
-            ).then(
-                lambda x: x,
-                inputs=[chatbot],
-                outputs=[chat_history]
+                inputs=[session_select_callback],
+                outputs=[chatbot, chat_history, load_earlier_btn]
+            )
+
+            # -- Fetching the previous page of a reopened chat
+            load_earlier_btn.click(
+                load_earlier,
+                inputs=[chat_history],
+                outputs=[chatbot, chat_history, load_earlier_btn]
             )
             
             # -- Rename a chat session
@@ -824,14 +856,10 @@ html, body {
                 outputs=[session_list, session_html]
             )
 
+            # -- Saved sessions survive restarts: fill the sidebar from the store
+            demo.load(restore_sessions, outputs=[session_list, session_html])
+
             # -- On initial load, show a welcome
-            demo.load(
-                lambda: [{"role": "assistant", "content": "👋 Welcome to W3 BrainBot!"}],
-                outputs=[chatbot]
-            ).then(
-                lambda x: x,
-                inputs=[chatbot],
-                outputs=[chat_history]
-            )
+            demo.load(welcome, outputs=[chatbot, chat_history])
 
 demo.launch(favicon_path='W3_Nobg.png', server_name="192.168.0.227", server_port=8000)
\ No newline at end of file
@@ -1,8 +1,22 @@
 import gradio as gr
 import datetime
-import chromadb
-from sentence_transformers import SentenceTransformer
+import time
 import base64
+from html import escape as html_escape
+from modularization.chatbot import model_provider
+from modularization.chatbot.context_assembler import ContextAssembler, warm_up_tokenizer
+from modularization.chatbot.conversation_memory import ConversationMemory
+from modularization.chatbot.embedding_cache import EmbeddingCache
+from modularization.chatbot.embedding_scheduler import EmbeddingScheduler
+from modularization.chatbot.embedding_pool import EmbeddingPool
+from modularization.chatbot.message_log import MessageLog
+from modularization.chatbot.answer_cache import SemanticAnswerCache
+from modularization.chatbot.rerank import Reranker
+from modularization.chatbot.session_manager import ShardedSessionStore, request_owner, OWNER_COOKIE_JS
+from modularization.chatbot.session_search import SessionIndex
+from modularization.chatbot.summarizer import RollingSummarizer
+from modularization.chatbot.embedding_config import EMBEDDING_MODEL
+from modularization.chatbot.retrieval import Retriever, ManifestWatcher
 #== Work from here============
 # === Simulated RAG Embedding Contexts ===
 RAG_CONTEXTS = {
@@ -20,18 +34,136 @@ markdown_content = f"""
 </h1>
 """
 
-# Global storage for saved chat sessions
-chat_sessions = {}
+# Saved chat sessions (SQLite, survives restarts), one partition per user / browser (see request_owner).
+# SESSION_SHARDS independent stores, so different users' handlers don't share a lock.
+SESSION_SHARDS = 8
+
+# === Vector retrieval over chroma_db (one collection per context) ===
+# RETRIEVAL_P95_BUDGET_MS: p95 latency budget reported with every reply
+# QUERY_CACHE_DIR: memory-mapped tier of the query-embedding cache (None = RAM only)
+# FUSION_WEIGHTS: (vector, lexical) reciprocal-rank-fusion weights per context;
+#   Technology leans on BM25 so exact identifiers / error codes still match
+# RERANK_BUDGET_MS: per-request cross-encoder budget (None disables reranking)
+# MMR_LAMBDA: relevance/diversity trade-off for dropping near-duplicate passages (None disables)
+# KB_MANIFEST: JSON with "chroma_path" / "contexts"; edits are hot-swapped in without a restart
+RETRIEVAL_TOP_K = 3
+RETRIEVAL_P95_BUDGET_MS = 250.0
+RERANK_BUDGET_MS = 60.0
+MMR_LAMBDA = 0.7  # 1.0 = pure relevance, lower = more diverse passages
+FUSION_WEIGHTS = {
+    "Science": (1.0, 0.5),
+    "History": (1.0, 1.0),
+    "Technology": (1.0, 1.5),
+}
+QUERY_CACHE_SIZE = 4096
+QUERY_CACHE_DIR = ".cache/query_embeddings"
+KB_MANIFEST = "knowledge_base.json"
+KB_POLL_SECONDS = 10.0
+# ANSWER_CACHE_THRESHOLDS: cosine similarity a past question needs for its answer to be reused
+ANSWER_CACHE_THRESHOLD = 0.92
+ANSWER_CACHE_THRESHOLDS = {
+    "Technology": 0.95,  # "error 404" vs "error 403" embed very close
+}
+ANSWER_CACHE_TTL_SECONDS = 3600
+ANSWER_CACHE_SIZE = 1024
+# MEMORY_RECENT_MESSAGES: latest messages used verbatim; older exchanges are
+#   recalled from turn-level vector memory (MEMORY_RELEVANT_TURNS closest ones)
+MEMORY_RECENT_MESSAGES = 6
+MEMORY_RELEVANT_TURNS = 3
+# SUMMARY_THRESHOLD: new older messages needed before the rolling summary is updated
+SUMMARY_THRESHOLD = 10
+SUMMARY_SENTENCES = 5
+# HISTORY_PAGE_SIZE: messages sent when a saved chat is opened, and per "load earlier" click
+HISTORY_PAGE_SIZE = 50
+# CONTEXT_BUDGET_TOKENS: per-request cap on context text + passages + turns
+CONTEXT_BUDGET_TOKENS = 1024
+# SESSION_SEARCH_DEBOUNCE_MS: pause in typing before the sidebar search runs
+SESSION_SEARCH_RESULTS = 10
+SESSION_SEARCH_DEBOUNCE_MS = 250
+# ENCODER_BACKEND: "torch" (fp32), "onnx" or "int8" - see chatbot.encoder_benchmark
+# EMBEDDING_WORKERS > 0 runs MiniLM in worker processes so UI handlers keep the GIL;
+#   each scheduler batch is split evenly across them
+ENCODER_BACKEND = "torch"
+EMBEDDING_WORKERS = 2
+
+def encode_in_process(sentences, **kwargs):
+    return model_provider.encode(sentences, backend=ENCODER_BACKEND, **kwargs)
+
+def warm_up_embeddings():
+    if embedding_pool:
+        embedding_pool.start()
+    else:
+        model_provider.warm_up(backend=ENCODER_BACKEND)
+    if reranker is not None:
+        reranker.warm_up()
+    warm_up_tokenizer()
+
+# Stores, caches, the embedding pool and the manifest watcher
+chat_sessions = ShardedSessionStore(shards=SESSION_SHARDS)
+embedding_pool = EmbeddingPool(processes=EMBEDDING_WORKERS, backend=ENCODER_BACKEND) if EMBEDDING_WORKERS else None
+# Concurrent submits are coalesced into one forward pass (5 ms window / 32 items)
+embedding_scheduler = EmbeddingScheduler(
+    # MiniLM is loaded on first use / warm-up, not at import
+    embedding_pool.encode if embedding_pool else encode_in_process,
+    max_batch_size=32,
+    max_wait_ms=5.0,
+)
+query_cache = EmbeddingCache(
+    embedding_scheduler.encode,
+    model_name=f"{EMBEDDING_MODEL}:{ENCODER_BACKEND}",
+    max_entries=QUERY_CACHE_SIZE,
+    disk_path=QUERY_CACHE_DIR,
+)
+reranker = Reranker(budget_ms=RERANK_BUDGET_MS) if RERANK_BUDGET_MS else None
+retriever = Retriever(
+    query_cache.encode,
+    top_k=RETRIEVAL_TOP_K,
+    p95_budget_ms=RETRIEVAL_P95_BUDGET_MS,
+    fusion_weights=FUSION_WEIGHTS,
+    reranker=reranker,
+    mmr_lambda=MMR_LAMBDA,
+    contexts=RAG_CONTEXTS,
+)
+kb_watcher = ManifestWatcher(retriever, KB_MANIFEST, interval=KB_POLL_SECONDS)
+# Answers reused for near-duplicate questions (skips retrieval entirely)
+answer_cache = SemanticAnswerCache(
+    threshold=ANSWER_CACHE_THRESHOLD,
+    thresholds=ANSWER_CACHE_THRESHOLDS,
+    ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+    max_entries=ANSWER_CACHE_SIZE,
+)
+# Saved sessions in chroma_db's chat_sessions collection, searched from the sidebar
+session_index = SessionIndex(query_cache.encode, store=chat_sessions)
+# One vector per exchange (chat_turns collection), keyed by stored session id;
+# one-off turn texts go to the scheduler, not the query cache
+conversation_memory = ConversationMemory(embedding_scheduler.encode)
+context_assembler = ContextAssembler(budget_tokens=CONTEXT_BUDGET_TOKENS)
+# Extractive summary of messages older than the recent window (sentences nearest the centroid)
+summarizer = RollingSummarizer(
+    embedding_scheduler.encode, threshold=SUMMARY_THRESHOLD, max_sentences=SUMMARY_SENTENCES
+)
+
+# Spawned embedding workers re-import this file as __mp_main__; they only need
+# the model, so they skip the watcher thread (and the UI below). Building the
+# objects above only opens the stores; the pool spawns on warm-up and models
+# load on first use.
+if __name__ != "__mp_main__":
+    kb_watcher.start()
+    warm_up_tokenizer()  # the context assembler counts tokens on the first request
 
 # Generate a unique chat session name
 def generate_chat_name():
     return datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
+# The requesting user's (or browser's) partition of the session store
+def sessions_for(request):
+    return chat_sessions.for_owner(request_owner(request))
+
 # -------------------------------
 # Chatbot response function
 # (handles multimodal input too)
 # -------------------------------
-def chatbot_response(user_input, chat_history, selected_context):
+def chatbot_response(user_input, chat_history, selected_context, sessions=None):
     print("[DEBUG] chatbot_response() called with user_input=", user_input, " context=", selected_context)
 
     if isinstance(user_input, dict):  # e.g., user uploaded a file
@@ -41,43 +173,106 @@ def chatbot_response(user_input, chat_history, selected_context):
 
     if not user_text:
         print("[DEBUG] Empty user input. Ignoring.")
-        return chat_history, ""  # Ignore empty messages
-
-    # Get context description
-    context_description = RAG_CONTEXTS.get(selected_context, "General Chatbot")
+        return chat_history.messages, ""  # Ignore empty messages
+
+    # Near-duplicate of an earlier question in this context? (same embedding the retriever would use)
+    start = time.perf_counter()
+    generation = retriever.generation.number
+    embedding = query_cache.encode([user_text], normalize_embeddings=True)[0]
+    cached = answer_cache.get(embedding, selected_context, generation)
+
+    # Earlier exchanges relevant to this question, beyond the recent messages kept verbatim
+    turn = chat_history.user_turns
+    recent_turns = MEMORY_RECENT_MESSAGES // 2
+    recalled = conversation_memory.relevant(
+        chat_history.session_id, embedding, k=MEMORY_RELEVANT_TURNS, before_turn=turn - recent_turns
+    )
+    print("[DEBUG] Conversation memory:", len(recalled), "earlier turns recalled of", turn)
+    recent = [f"{m.get('role')}: {m.get('content')}" for m in chat_history.messages[-MEMORY_RECENT_MESSAGES:]]
+    older = [f"(turn {n + 1}) {text.splitlines()[0]}" for n, text, _ in recalled]
+    older_end = max(chat_history.end - MEMORY_RECENT_MESSAGES, 0)
+    # incremental, in the background, and stored next to the session when it changes
+    sessions = sessions or sessions_for(None)
+    session_id = chat_history.session_id
+    summarizer.update(
+        session_id, chat_history.messages, older_end, chat_history.offset,
+        save=lambda text, upto: sessions.set_summary(session_id, text, upto),
+        # stored messages between the seeded summary and the loaded pages
+        load=lambda begin, stop: (sessions.get_page(session_id, before=stop, limit=stop - begin) or ([], 0))[0],
+    )
+    summary = summarizer.summary(chat_history.session_id)
+
+    if cached is not None:
+        # Cached entries are shared by all users: only the retrieved passages, never a question
+        (context_description, passages), similarity = cached
+        print("[DEBUG] Answer cache hit:", answer_cache.stats())
+    else:
+        # Top-k retrieval from the context's collection (in the currently published index generation)
+        result = retriever.retrieve(user_text, selected_context)
+        context_description = result.description or "General Chatbot"
+        passages = [passage for passage in result.passages if passage]
+        print("[DEBUG] Retrieved", len(result.passages), "passages:", result.format_timing())
+        print("[DEBUG] Query cache:", query_cache.stats(), "Result cache:", retriever.result_cache.stats())
+        print("[DEBUG] Answer cache:", answer_cache.stats())
+        answer_cache.put(embedding, selected_context, (context_description, passages), result.generation)
+
+    # Fit context text, passages, recent and older turns into the token budget
+    system = f"[{selected_context} Context] {context_description} - You asked: '{user_text}'"
+    context = context_assembler.assemble(system, passages=passages, recent=recent, older=older, summary=summary)
 
     # Generate bot response
-    bot_reply = f"[{selected_context} Context] {context_description} - You asked: '{user_text}'"
-
-    # Append user message first
-    updated_history = list(chat_history)
-    updated_history.append({"role": "user", "content": user_text})
+    answer = system
+    if context.passages:
+        answer += "\n\n" + "\n\n".join(f"> {passage}" for passage in context.passages)
+    if cached is not None:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        bot_reply = answer + f"\n\n_⚡ cached answer ({similarity:.2f} match) · {elapsed_ms:.1f} ms · {context.format_report()}_"
+    else:
+        bot_reply = answer + f"\n\n_{result.format_timing()} · {context.format_report()}_"
+    # Recalled turns are context for the answer, not part of it; they only show up in the log
+    print("[DEBUG] Context:", context.format_report(), "| summary:", context.summary or "-",
+          "| recalled:", len(context.older))
 
     # ✅ Force non-empty bot response (prevents flickering)
     if not bot_reply.strip():
         bot_reply = " "
 
-    # Append bot message (ensures there's always content)
-    updated_history.append({"role": "assistant", "content": bot_reply})
+    # Append the user message and the bot message to the log (two records, no history copy)
+    chat_history.append(
+        sessions, lambda: sessions.create_session(generate_chat_name()),
+        {"role": "user", "content": user_text},
+        {"role": "assistant", "content": bot_reply},  # ensures there's always content
+    )
+    # Under the stored session id (created by the append above), so a reopened chat finds its turns
+    conversation_memory.add(chat_history.session_id, turn, user_text, answer)  # embedded in the background
 
-    return updated_history, ""  # ✅ Ensures no flickering
+    return chat_history.messages, ""  # ✅ Ensures no flickering
 
 
 
 # -------------------------------------------
 # Start a new chat, optionally save old one
 # -------------------------------------------
-def start_new_chat(selected_context, chat_history, session_list):
+def start_new_chat(selected_context, chat_history, session_list, request: gr.Request = None):
     print("[DEBUG] start_new_chat() triggered with context=", selected_context)
+    owner = request_owner(request)
+    sessions = sessions_for(request)
     
-    if chat_history:
-        # Save previous session if not empty
-        chat_name = generate_chat_name()
-        chat_sessions[chat_name] = list(chat_history)
-        session_list = list(session_list)
-        session_list.append(chat_name)
-
-        print("[DEBUG] Saved session as:", chat_name, "with", len(chat_history), "messages")
+    if chat_history and chat_history.session_id:
+        # The session's messages are already stored turn by turn; just list it
+        session_id = chat_history.session_id
+        chat_name = session_list.get(session_id) or sessions.get_name(session_id) or session_id
+        if session_id not in session_list:
+            session_list = dict(session_list)
+            session_list[session_id] = chat_name
+
+        print("[DEBUG] Saved session", session_id, "as:", chat_name, "with", len(chat_history), "messages")
+        # A reopened chat may hold only its latest pages; index the whole stored session
+        history = chat_history.messages if not chat_history.offset else sessions.get_session(session_id)
+        # embedded in the background, with the rolling summary stored alongside
+        session_index.add(
+            session_id, chat_name, history, summary=summarizer.summary(session_id), owner=owner
+        )
 
     welcome_message = f"🔄 New chat started with **{selected_context}** context!"
     
@@ -87,26 +282,103 @@ def start_new_chat(selected_context, chat_history, session_list):
     # Fresh chat: assistant greeting
     new_chat = [{"role": "assistant", "content": welcome_message}]
     
-    # Return new chat, cleared chat_history, updated session_list, updated HTML
-    return new_chat, [], session_list, session_html
+    # Return new chat, a fresh log, updated session_list, updated HTML, nothing earlier
+    return new_chat, MessageLog(new_chat), session_list, session_html, gr.update(visible=False)
 
 # ---------------------------------------------
-# Load a past chat by index from 'session_list'
+# Warm the selected context's index partition
 # ---------------------------------------------
-def load_chat(selected_index_str, session_list):
-    print("[DEBUG] load_chat() triggered with selected_index_str=", selected_index_str)
-    
+def prefetch_context(selected_context):
+    print("[DEBUG] prefetch_context() triggered with context=", selected_context)
+    retriever.prefetch(selected_context)  # runs in the background, returns immediately
+
+# Contexts of the published generation, so new page loads see a hot-swapped list
+def refresh_contexts(selected_context):
+    choices = list(retriever.contexts) or list(RAG_CONTEXTS)
+    return gr.update(choices=choices, value=selected_context if selected_context in choices else choices[0])
+
+# ---------------------------------------------
+# Load a past chat by its session id
+# ---------------------------------------------
+# (only the latest HISTORY_PAGE_SIZE messages are sent; earlier pages on request)
+def load_chat(session_id, request: gr.Request = None):
+    print("[DEBUG] load_chat() triggered with session_id=", session_id)
+    if not session_id:
+        return [], MessageLog(), gr.update(visible=False)  # Return empty if invalid selection
+
+    sessions = sessions_for(request)
+    page = sessions.get_page(session_id, limit=HISTORY_PAGE_SIZE)
+    if page is not None:
+        messages, start = page
+        print("[DEBUG] Loaded", len(messages), "latest messages,", start, "earlier ones not sent")
+        # The rolling summary carries on from the stored one instead of starting over
+        summarizer.seed(session_id, *sessions.get_summary(session_id))
+        log = MessageLog(
+            messages, session_id=session_id, offset=start, user_turns=sessions.get_user_turns(session_id)
+        )
+        return messages, log, gr.update(visible=start > 0)
+    return [], MessageLog(), gr.update(visible=False)  # not one of this owner's sessions
+
+# Prepend the page before the earliest loaded message (cursor: the log's offset)
+def load_earlier(chat_history, request: gr.Request = None):
+    if not isinstance(chat_history, MessageLog) or not chat_history.session_id or not chat_history.offset:
+        return gr.update(), chat_history, gr.update(visible=False)
+    page = sessions_for(request).get_page(chat_history.session_id, before=chat_history.offset, limit=HISTORY_PAGE_SIZE)
+    if page is None:
+        return gr.update(), chat_history, gr.update(visible=False)
+    chat_history.prepend(page[0])
+    print("[DEBUG] load_earlier() added", len(page[0]), "messages,", chat_history.offset, "still earlier")
+    return chat_history.messages, chat_history, gr.update(visible=chat_history.offset > 0)
+
+# ---------------------------------------------
+# Saved sessions from the store, for the sidebar
+# ---------------------------------------------
+def restore_sessions(request: gr.Request = None):
+    sessions = sessions_for(request).session_names()
+    print("[DEBUG] restore_sessions() found", len(sessions), "saved sessions")
+    return sessions, create_session_html(sessions)
+
+# Greeting shown on page load; also the start of the first log
+def welcome():
+    messages = [{"role": "assistant", "content": "👋 Welcome! This chatbot uses the **Science** context."}]
+    return messages, MessageLog(messages)
+
+# ---------------------------------------------
+# Sidebar search over saved sessions
+# ---------------------------------------------
+def search_sessions(query, session_list, request: gr.Request = None):
+    print("[DEBUG] search_sessions() triggered with query=", query)
+    if not query or not query.strip():
+        return create_session_html(session_list)
     try:
-        idx = int(selected_index_str)
-        if 0 <= idx < len(session_list):
-            chat_name = session_list[idx]
-            print("[DEBUG] Loading chat_name =", chat_name)
-            if chat_name in chat_sessions:
-                return chat_sessions[chat_name]
-    except (ValueError, TypeError):
-        print("[DEBUG] Invalid index or parse error.")
-    
-    return []  # Return empty if invalid selection
+        hits = session_index.search(query, k=SESSION_SEARCH_RESULTS, owner=request_owner(request))
+    except Exception as e:
+        print("[WARN] Session search failed:", e)
+        hits = []
+    return create_search_results_html(hits)
+
+def create_search_results_html(hits):
+    if not hits:
+        return "<div class='session-list'>No matching chats</div>"
+    html = "<div class='session-list'>"
+    for session_id, name, score in hits:
+        name = html_escape(name)
+        html += f"""
+        <div class='session-item' data-session-id='{html_escape(session_id)}'>
+            <div class='session-name'>{name}</div>
+            <div class='session-score'>{score:.2f}</div>
+        </div>
+        """
+    html += "</div>"
+    html += """
+    <style>
+    .session-score {
+        font-size: 11px;
+        color: #9aa4b8;
+    }
+    </style>
+    """
+    return html
 
 # ---------------------------------------------
 # Build HTML for sessions (sidebar list)
@@ -118,10 +390,10 @@ def create_session_html(sessions):
         return "<div class='session-list'>No saved chats yet</div>"
     
     html = "<div class='session-list'>"
-    for i, session in enumerate(sessions):
+    for session_id, name in sessions.items():
         html += f"""
-        <div class='session-item' data-index='{i}'>
-            <div class='session-name'>{session}</div>
+        <div class='session-item' data-session-id='{html_escape(session_id)}'>
+            <div class='session-name'>{html_escape(name)}</div>
         </div>
         """
     html += "</div>"
@@ -166,16 +438,31 @@ def create_session_html(sessions):
 # ----------------------------------------------
 custom_js = """
 <script>
+// Sidebar search: forward the query to the hidden callback once typing pauses
+var sessionSearchTimer = null;
+document.addEventListener("input", function(e){
+  if (!e.target.closest("#session-search")) return;
+  var query = e.target.value;
+  clearTimeout(sessionSearchTimer);
+  sessionSearchTimer = setTimeout(function(){
+    var hiddenBox = document.querySelector("#session-search-callback textarea");
+    if (!hiddenBox) return;
+    hiddenBox.value = query;
+    hiddenBox.dispatchEvent(new Event("input", { bubbles: true }));
+  }, SESSION_SEARCH_DEBOUNCE_MS);
+});
+
 document.addEventListener("click", function(e){
   var item = e.target.closest(".session-item");
   if (!item) return;
 
-  console.log("[DEBUG] Clicked .session-item with index:", item.dataset.index);
+  console.log("[DEBUG] Clicked .session-item with id:", item.dataset.sessionId);
 
   // We select the actual <textarea> inside #session-select-callback
   var hiddenBox = document.querySelector("#session-select-callback textarea");
   if (hiddenBox) {
-    hiddenBox.value = item.dataset.index;
+    // Saved chats and search results both carry the session id
+    hiddenBox.value = item.dataset.sessionId;
     console.log("[DEBUG] Setting hidden callback value:", hiddenBox.value);
     // Dispatch 'input' event to match .input(...) in Python
     hiddenBox.dispatchEvent(new Event("input", { bubbles: true }));
@@ -184,15 +471,12 @@ document.addEventListener("click", function(e){
   }
 });
 </script>
-"""
+""".replace("SESSION_SEARCH_DEBOUNCE_MS", str(SESSION_SEARCH_DEBOUNCE_MS))
 
 # =============================================
 #    Gradio UI Setup with Blocks
 # =============================================
-with gr.Blocks(
-    head=custom_js,
-    theme=gr.themes.Base(primary_hue="blue", neutral_hue="gray", text_size=gr.themes.sizes.text_md),
-    css="""
+custom_css = """
 
 /* === Ensure No Hidden Width Expansion Anywhere === */
 * {
@@ -424,104 +708,148 @@ html, body {
 }
 /* Change chatbot message background */
 """
-) as demo:
-    with gr.Row(min_height=700):
-        # -------------- Sidebar --------------
-        with gr.Column(scale=1, elem_classes=["sidebar"], min_width=250):
-            gr.Markdown(markdown_content)
-
-            new_chat_btn = gr.Button("➕ New Chat", elem_classes=["new-chat-btn"])
-            session_list = gr.State([])  
-            session_html = gr.HTML("<div class='session-list'>No saved chats yet</div>")
+
+def build_demo():
+    with gr.Blocks(
+        head=OWNER_COOKIE_JS + custom_js,
+        theme=gr.themes.Base(primary_hue="blue", neutral_hue="gray", text_size=gr.themes.sizes.text_md),
+        css=custom_css,
+    ) as demo:
+        with gr.Row(min_height=700):
+            # -------------- Sidebar --------------
+            with gr.Column(scale=1, elem_classes=["sidebar"], min_width=250):
+                gr.Markdown(markdown_content)
+
+                new_chat_btn = gr.Button("➕ New Chat", elem_classes=["new-chat-btn"])
+                session_list = gr.State({})  # session id -> display name
+                # Reached from the JS by elem_id only
+                gr.Textbox(
+                    placeholder="🔍 Search chats...",
+                    show_label=False,
+                    elem_id="session-search",
+                )
+                session_html = gr.HTML("<div class='session-list'>No saved chats yet</div>")
             
-            # Hidden textbox for session selection
-            # Must have interactive=True + the correct elem_id
-            session_select_callback = gr.Textbox(
-                elem_id="session-select-callback", 
-                visible=False,
-                interactive=True
-            )
-
-        # -------------- Main Chat UI --------------
-        with gr.Column(min_width=1100,scale=30, elem_classes=["main-chat-ui"]):
-
-            context_selector = gr.Dropdown(
-                choices=list(RAG_CONTEXTS.keys()),
-                value="Science",
-                show_label=False,
-                elem_id="context-selector",
-            )
-
-            chatbot = gr.Chatbot(
-                show_label=False,
-                type="messages",
-                min_height=750,
-                min_width=600,
-                height=650,  # Ensures it doesn’t dynamically resize
-            )
-
-            with gr.Row():
-                message_input = gr.MultimodalTextbox(
-                    show_label=False, 
-                    placeholder="Type your message here...",
-                    file_types=[".pdf", ".txt", ".png", ".jpg", ".jpeg"],
-                    scale=10,
-                    elem_id="message-input",
+                # Hidden textbox for session selection
+                # Must have interactive=True + the correct elem_id
+                session_select_callback = gr.Textbox(
+                    elem_id="session-select-callback", 
+                    visible=False,
+                    interactive=True
+                )
+                # Debounced copy of session_search, filled by JS
+                session_search_callback = gr.Textbox(
+                    elem_id="session-search-callback",
+                    visible=False,
+                    interactive=True
+                )
+
+            # -------------- Main Chat UI --------------
+            with gr.Column(min_width=1100,scale=30, elem_classes=["main-chat-ui"]):
+
+                context_selector = gr.Dropdown(
+                    choices=list(RAG_CONTEXTS.keys()),
+                    value="Science",
+                    show_label=False,
+                    elem_id="context-selector",
+                )
+
+                # Shown while a reopened chat has stored messages older than the loaded ones
+                load_earlier_btn = gr.Button("⬆ Load earlier messages", visible=False, size="sm")
+
+                chatbot = gr.Chatbot(
+                    show_label=False,
+                    type="messages",
+                    min_height=750,
+                    min_width=600,
+                    height=650,  # Ensures it doesn’t dynamically resize
+                )
+
+                with gr.Row():
+                    message_input = gr.MultimodalTextbox(
+                        show_label=False, 
+                        placeholder="Type your message here...",
+                        file_types=[".pdf", ".txt", ".png", ".jpg", ".jpeg"],
+                        scale=10,
+                        elem_id="message-input",
+                    )
+
+                # Append-only MessageLog (see chatbot.message_log); never round-tripped through the client
+                chat_history = gr.State(None)
+
+                # --- Send message handler ---
+                def handle_message(user_input, history, context, request: gr.Request):
+                    print("[DEBUG] handle_message triggered.")
+                    if not isinstance(history, MessageLog):
+                        history = MessageLog(list(history or []))
+                    new_history, _ = chatbot_response(user_input, history, context, sessions_for(request))
+                    return new_history, "", history
+
+                # -- Pressing Enter in the message_input
+                message_input.submit(
+                    handle_message,
+                    inputs=[message_input, chat_history, context_selector],
+                    outputs=[chatbot, message_input, chat_history]
                 )
 
-            chat_history = gr.State([])
-
-            # --- Send message handler ---
-            def handle_message(user_input, history, context):
-                print("[DEBUG] handle_message triggered.")
-                new_history, _ = chatbot_response(user_input, history, context)
-                return new_history, ""
-
-            # -- Pressing Enter in the message_input
-            message_input.submit(
-                handle_message,
-                inputs=[message_input, chat_history, context_selector],
-                outputs=[chatbot, message_input]
-            ).then(
-                lambda x: x,
-                inputs=[chatbot],
-                outputs=[chat_history]
-            )
-
-            # -- Changing context => new chat
-            context_selector.change(
-                start_new_chat,
-                inputs=[context_selector, chat_history, session_list],
-                outputs=[chatbot, chat_history, session_list, session_html]
-            )
-
-            # -- "New Chat" button
-            new_chat_btn.click(
-                start_new_chat,
-                inputs=[context_selector, chat_history, session_list],
-                outputs=[chatbot, chat_history, session_list, session_html]
-            )
-
-            # -- Loading a past session
-            #   session_select_callback is triggered by JS dispatchEvent("input")
-            session_select_callback.input(
-                load_chat,
-                inputs=[session_select_callback, session_list],
-                outputs=[chatbot]
-            ).then(
-                lambda x: x,
-                inputs=[chatbot],
-                outputs=[chat_history]
-            )
-
-            # -- On initial load, show a welcome
-            demo.load(
-                lambda: [{"role": "assistant", "content": "👋 Welcome! This chatbot uses the **Science** context."}],
-                outputs=[chatbot]
-            ).then(
-                lambda x: x,
-                inputs=[chatbot],
-                outputs=[chat_history]
-            )
-
-demo.launch(favicon_path='W3_Nobg.png', server_name="192.168.0.227", server_port=8000)
+                # -- Changing context => new chat
+                context_selector.change(
+                    start_new_chat,
+                    inputs=[context_selector, chat_history, session_list],
+                    outputs=[chatbot, chat_history, session_list, session_html, load_earlier_btn]
+                )
+
+                # -- Changing context => warm that context's index partition in the background
+                context_selector.change(
+                    prefetch_context,
+                    inputs=[context_selector],
+                )
+
+                # -- "New Chat" button
+                new_chat_btn.click(
+                    start_new_chat,
+                    inputs=[context_selector, chat_history, session_list],
+                    outputs=[chatbot, chat_history, session_list, session_html, load_earlier_btn]
+                )
+
+                # -- Searching saved sessions (debounced in JS; only the latest pending query runs)
+                session_search_callback.input(
+                    search_sessions,
+                    inputs=[session_search_callback, session_list],
+                    outputs=[session_html],
+                    trigger_mode="always_last",
+                )
+
+                # -- Loading a past session
+                #   session_select_callback is triggered by JS dispatchEvent("input")
+                session_select_callback.input(
+                    load_chat,
+                    inputs=[session_select_callback],
+                    outputs=[chatbot, chat_history, load_earlier_btn]
+                )
+
+                # -- Fetching the previous page of a reopened chat
+                load_earlier_btn.click(
+                    load_earlier,
+                    inputs=[chat_history],
+                    outputs=[chatbot, chat_history, load_earlier_btn]
+                )
+
+                # -- Load the embedding model and the default partition in the background once the UI is serving
+                demo.load(warm_up_embeddings)
+                demo.load(lambda: prefetch_context("Science"))
+                demo.load(refresh_contexts, inputs=[context_selector], outputs=[context_selector])
+
+                # -- Saved sessions survive restarts: fill the sidebar from the store
+                demo.load(restore_sessions, outputs=[session_list, session_html])
+
+                # -- On initial load, show a welcome
+                demo.load(welcome, outputs=[chatbot, chat_history])
+    return demo
+
+# Module-level so importing this file (e.g. `gradio idk.py` reload mode) finds it;
+# spawned embedding workers (__mp_main__) neither build the UI nor launch a server
+demo = build_demo() if __name__ != "__mp_main__" else None
+
+if __name__ == "__main__":
+    demo.launch(favicon_path='W3_Nobg.png', server_name="192.168.0.227", server_port=8000)
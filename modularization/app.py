@@ -1,5 +1,6 @@
 import gradio as gr
 from chatbot.chatbot_logic import Chatbot
+from chatbot.message_log import MessageLog
 from chatbot.ui_components import build_ui, create_session_html
 import base64
 
@@ -29,7 +30,7 @@ with gr.Blocks(
         with gr.Column(scale=1, elem_classes=["sidebar"], min_width=250):
             gr.Markdown(markdown_content)
             new_chat_btn = gr.Button("➕  New Chat", elem_classes=["new-chat-btn", "spaced-icon-btn"], interactive=False)
-            session_list = gr.State([])  
+            session_list = gr.State({})  # {session id: name}
             session_html = gr.HTML("<div class='session-list'></div>")
 
             # Hidden textbox for session selection
@@ -50,45 +51,44 @@ with gr.Blocks(
                     elem_id="message-input", max_plain_text_length=8000, max_lines=8000
                 )
 
-            chat_history = gr.State([])
+            # Append-only MessageLog (see chatbot.message_log); the session is stored as it grows
+            chat_history = gr.State(None)
 
             def handle_message(user_input, history, session_list):
                 """Handle message input from user and update session HTML"""
                 user_text = str(user_input).strip() if not isinstance(user_input, dict) else user_input.get("text", "").strip()
+                if not isinstance(history, MessageLog):
+                    history = MessageLog(list(history or []))
 
                 if not user_text:
-                    return history, "", session_list, session_html
-
-                # Ensure session creation and processing of user message
-                if len(history) == 0:
-                    chat_name = chatbot.generate_chat_name()
-                    session_list = list(session_list)
-                    if chat_name not in chatbot.chat_sessions:
-                        chatbot.chat_sessions[chat_name] = [{"role": "assistant", "content": "👋 Welcome to W3 BrainBot!"}]
-                        session_list.append(chat_name)
+                    return history.messages, "", history, session_list, create_session_html(session_list)
 
+                # The first message creates the stored session; list it by id
                 new_history, _ = chatbot.chatbot_response(user_text, history)
-                new_history.append({"role": "user", "content": user_text})
-
-                if len(history) == 0:
-                    chatbot.chat_sessions[chat_name] = new_history  # Save first message
+                if history.session_id not in session_list:
+                    session_list = dict(session_list)
+                    session_list[history.session_id] = chatbot.chat_sessions.get_name(history.session_id) or history.session_id
 
                 # Update session HTML after handling the message
                 session_html = create_session_html(session_list)
 
-                return new_history, "", session_list, session_html
+                return new_history, "", history, session_list, session_html
+
+            def new_chat(history, session_list):
+                new_messages, log, session_list = chatbot.start_new_chat(history, session_list)
+                return new_messages, log, session_list, create_session_html(session_list)
 
             message_input.submit(
                 handle_message,
                 inputs=[message_input, chat_history, session_list],
-                outputs=[chatbot_component, message_input, session_list, session_html]
+                outputs=[chatbot_component, message_input, chat_history, session_list, session_html]
             ).then(
                 lambda: gr.update(interactive=True), outputs=[new_chat_btn]
             )
 
             # New Chat Button
             new_chat_btn.click(
-                chatbot.start_new_chat,
+                new_chat,
                 inputs=[chat_history, session_list],
                 outputs=[chatbot_component, chat_history, session_list, session_html]
             ).then(
@@ -97,6 +97,10 @@ with gr.Blocks(
 
             # Loading past session
             session_select_callback.input(
-                chatbot.load_chat, inputs=[session_select_callback, session_list], outputs=[chatbot_component]
+                chatbot.load_chat, inputs=[session_select_callback],
+                outputs=[chatbot_component, chat_history]
             )
 
+    # Load the embedding model in the background once the page is being served
+    demo.load(chatbot.warm_up)
+
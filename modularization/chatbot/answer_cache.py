@@ -0,0 +1,120 @@
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .embedding_config import EMBEDDING_DIM
+
+
+class _Partition:
+    """One context's cached questions: a fixed matrix of unit vectors plus an LRU of used rows."""
+
+    def __init__(self, capacity, dim):
+        self.matrix = np.zeros((capacity, dim), dtype=np.float32)
+        self.expires = np.full(capacity, -np.inf)
+        self.entries = [None] * capacity  # (answer, generation)
+        self.lru = OrderedDict()  # row -> None, least recently used first
+        self.free = list(range(capacity - 1, -1, -1))
+
+    def drop(self, row):
+        self.expires[row] = -np.inf
+        self.entries[row] = None
+        self.lru.pop(row, None)
+        self.free.append(row)
+
+
+class SemanticAnswerCache:
+    """Answers keyed by question embedding, reused for near-duplicate questions in the same context.
+
+    A lookup is one matvec against the context's cached question vectors;
+    the best match counts as a hit when its cosine similarity reaches the
+    context's threshold. Entries expire after `ttl_seconds` and each context
+    keeps at most `max_entries`, evicting the least recently used. Entries
+    are tagged with the index generation they were answered from, so a
+    knowledge-base swap never serves stale answers.
+
+    The cache is shared by every user, so entries keep no question text:
+    store only what was retrieved and render it for the current question.
+    """
+
+    def __init__(self, threshold=0.92, thresholds=None, ttl_seconds=3600.0, max_entries=1024, dim=EMBEDDING_DIM):
+        self.threshold = threshold
+        # Per-context overrides, e.g. stricter for contexts where wording matters
+        self.thresholds = thresholds or {}
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.dim = dim
+        self._partitions = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def _partition(self, context):
+        partition = self._partitions.get(context)
+        if partition is None:
+            partition = self._partitions[context] = _Partition(self.max_entries, self.dim)
+        return partition
+
+    @staticmethod
+    def _unit(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def get(self, embedding, context, generation=0):
+        """Return (answer, similarity) for the closest fresh match, or None."""
+        query = self._unit(embedding)
+        now = time.monotonic()
+        with self._lock:
+            partition = self._partitions.get(context)
+            if partition is None or not partition.lru:
+                self.misses += 1
+                return None
+            for row in np.flatnonzero((partition.expires < now) & (partition.expires > -np.inf)):
+                partition.drop(int(row))
+                self.expired += 1
+            similarities = partition.matrix @ query
+            similarities[partition.expires == -np.inf] = -np.inf
+            row = int(np.argmax(similarities))
+            score = float(similarities[row])
+            entry = partition.entries[row]
+            if entry is not None and entry[1] != generation:
+                partition.drop(row)  # answered from a retired index generation
+                entry = None
+            if entry is None or score < self.thresholds.get(context, self.threshold):
+                self.misses += 1
+                return None
+            partition.lru.move_to_end(row)
+            self.hits += 1
+            return entry[0], score
+
+    def put(self, embedding, context, answer, generation=0):
+        with self._lock:
+            partition = self._partition(context)
+            if not partition.free:
+                oldest, _ = partition.lru.popitem(last=False)
+                partition.drop(oldest)
+                self.evictions += 1
+            row = partition.free.pop()
+            partition.matrix[row] = self._unit(embedding)
+            partition.expires[row] = time.monotonic() + self.ttl_seconds
+            partition.entries[row] = (answer, generation)
+            partition.lru[row] = None
+
+    def clear(self):
+        with self._lock:
+            self._partitions.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": sum(len(p.lru) for p in self._partitions.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "expired": self.expired,
+                "evictions": self.evictions,
+            }
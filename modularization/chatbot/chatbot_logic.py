@@ -1,55 +1,143 @@
 import datetime
-from sentence_transformers import SentenceTransformer
 import base64
 import time
+from functools import partial
+from . import model_provider
+from .answer_cache import SemanticAnswerCache
+from .embedding_cache import EmbeddingCache
+from .embedding_scheduler import EmbeddingScheduler
+from .embedding_pool import EmbeddingPool
+from .message_log import MessageLog
+from .rerank import Reranker
+from .session_manager import SessionManager
+from .embedding_config import EMBEDDING_MODEL
+from .retrieval import Retriever
+
+# === RAG Contexts (one collection per context in chroma_db) ===
+RAG_CONTEXTS = {
+    "Science": "This chatbot specializes in answering science-related questions.",
+    "History": "This chatbot provides insights into historical events and figures.",
+    "Technology": "This chatbot discusses the latest advancements in technology.",
+}
+DEFAULT_CONTEXT = "Science"
 
 class Chatbot:
-    def __init__(self):
-        self.chat_sessions = {}
-        self.sentence_transformer = SentenceTransformer('all-MiniLM-L6-v2')  # Example model
+    def __init__(self, top_k=3, p95_budget_ms=250.0, query_cache_size=4096, query_cache_dir=None,
+                 batch_size=32, batch_wait_ms=5.0, embedding_workers=0, encoder_backend=model_provider.DEFAULT_BACKEND,
+                 rerank_budget_ms=None, mmr_lambda=None, answer_cache_threshold=None, answer_cache_ttl=3600.0,
+                 sessions_db=None):
+        # Saved sessions live in SQLite, not in RAM
+        self.chat_sessions = SessionManager(sessions_db) if sessions_db else SessionManager()
+        self.encoder_backend = encoder_backend
+        # embedding_workers > 0 moves the encoder out of the Gradio process
+        self.embedding_pool = (
+            EmbeddingPool(EMBEDDING_MODEL, processes=embedding_workers, backend=encoder_backend)
+            if embedding_workers else None
+        )
+        if self.embedding_pool:
+            encode = self.embedding_pool.encode
+        else:
+            encode = partial(model_provider.encode, model_name=EMBEDDING_MODEL, backend=encoder_backend)
+        # Concurrent events share batched forward passes through the scheduler
+        self.embedding_scheduler = EmbeddingScheduler(encode, max_batch_size=batch_size, max_wait_ms=batch_wait_ms)
+        # Repeated queries are served from the cache instead of re-running MiniLM
+        self.query_cache = EmbeddingCache(
+            self.embedding_scheduler.encode, f"{EMBEDDING_MODEL}:{encoder_backend}",
+            max_entries=query_cache_size, disk_path=query_cache_dir,
+        )
+        # rerank_budget_ms enables the cross-encoder stage with that per-request budget
+        self.reranker = Reranker(budget_ms=rerank_budget_ms) if rerank_budget_ms else None
+        self.retriever = Retriever(
+            self.query_cache.encode, top_k=top_k, p95_budget_ms=p95_budget_ms, reranker=self.reranker,
+            mmr_lambda=mmr_lambda,
+        )
+        # answer_cache_threshold enables reusing answers for near-duplicate questions
+        self.answer_cache = (
+            SemanticAnswerCache(threshold=answer_cache_threshold, ttl_seconds=answer_cache_ttl)
+            if answer_cache_threshold else None
+        )
+
+    @property
+    def sentence_transformer(self):
+        """Process-wide MiniLM model, loaded on first use."""
+        return model_provider.get_model(EMBEDDING_MODEL, self.encoder_backend)
+
+    def warm_up(self):
+        """Start loading the embedding model (and the reranker) in the background."""
+        if self.embedding_pool:
+            self.embedding_pool.start()
+        else:
+            model_provider.warm_up(EMBEDDING_MODEL, self.encoder_backend)
+        if self.reranker is not None:
+            self.reranker.warm_up()
 
     def generate_chat_name(self):
         """Generate a unique chat session name based on current time"""
         return datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-    def chatbot_response(self, user_input, chat_history):
-        """Generate a response for the chatbot."""
+    def chatbot_response(self, user_input, chat_history, selected_context=DEFAULT_CONTEXT):
+        """Generate a response from the passages retrieved for the context and append the turn to the log.
+
+        `chat_history` is a MessageLog (a plain list is wrapped in one); the
+        turn's two messages are appended to it and stored, nothing is copied.
+        """
+        if not isinstance(chat_history, MessageLog):
+            chat_history = MessageLog(list(chat_history or []))
         if isinstance(user_input, dict):  # Handle multimodal input
             user_text = user_input.get("text", "")
         else:
             user_text = user_input.strip()
 
         if not user_text:
-            return chat_history, ""  # Ignore empty input
+            return chat_history.messages, ""  # Ignore empty input
+
+        cached = None
+        if self.answer_cache:
+            embedding = self.query_cache.encode([user_text], normalize_embeddings=True)[0]
+            cached = self.answer_cache.get(embedding, selected_context, self.retriever.generation.number)
+        if cached is not None:
+            # Shared by all users, so the cache holds the retrieved passages, never a question
+            (context_description, passages), similarity = cached
+            footer = f"⚡ cached answer ({similarity:.2f} match)"
+        else:
+            result = self.retriever.retrieve(user_text, selected_context)
+            context_description = result.description or RAG_CONTEXTS.get(selected_context, "General Chatbot")
+            passages = [passage for passage in result.passages if passage]
+            if self.answer_cache:
+                self.answer_cache.put(embedding, selected_context, (context_description, passages), result.generation)
+            footer = result.format_timing()
+        answer = f"[{selected_context} Context] {context_description} - You asked: '{user_text}'"
+        if passages:
+            answer += "\n\n" + "\n\n".join(f"> {passage}" for passage in passages)
+        bot_reply = answer + f"\n\n_{footer}_"
 
-        bot_reply = f"You asked: '{user_text}'"
-        updated_history = list(chat_history)
-        updated_history.append({"role": "user", "content": user_text})
-        
         if not bot_reply.strip():
             bot_reply = " "
 
-        updated_history.append({"role": "assistant", "content": bot_reply})
-        return updated_history, ""  # No flickering
+        # Two records appended (and stored) in place of a copied history
+        chat_history.append(
+            self.chat_sessions, lambda: self.chat_sessions.create_session(self.generate_chat_name()),
+            {"role": "user", "content": user_text},
+            {"role": "assistant", "content": bot_reply},
+        )
+        return chat_history.messages, ""  # No flickering
 
     def start_new_chat(self, chat_history, session_list):
-        """Start a new chat and save the session."""
-        if chat_history:
-            chat_name = self.generate_chat_name()
-            self.chat_sessions[chat_name] = list(chat_history)
-            if chat_name not in session_list:
-                session_list.append(chat_name)
-        welcome_message = "🔄 New chat started!"
-        return [{"role": "assistant", "content": welcome_message}], [], session_list
-
-    def load_chat(self, selected_index_str, session_list):
-        """Load a past chat by index."""
-        try:
-            idx = int(selected_index_str)
-            if 0 <= idx < len(session_list):
-                chat_name = session_list[idx]
-                if chat_name in self.chat_sessions:
-                    return self.chat_sessions[chat_name]
-        except (ValueError, TypeError):
-            pass
-        return []  # Return empty if invalid selection
+        """Start a new chat; the old one is already stored turn by turn, so it is only listed.
+
+        `session_list` is the sidebar's {session id: name}.
+        """
+        session_id = getattr(chat_history, "session_id", None)
+        if session_id and session_id not in session_list:
+            session_list = dict(session_list)
+            session_list[session_id] = self.chat_sessions.get_name(session_id) or session_id
+        new_chat = [{"role": "assistant", "content": "🔄 New chat started!"}]
+        return new_chat, MessageLog(new_chat), session_list
+
+    def load_chat(self, session_id):
+        """Load a past chat by its session id: (messages, MessageLog to continue it)."""
+        if session_id:
+            messages = self.chat_sessions.get_session(session_id)
+            if messages is not None:
+                return messages, MessageLog(messages, session_id=session_id)
+        return [], MessageLog()  # Return empty if invalid selection
@@ -0,0 +1,112 @@
+import re
+import time
+import threading
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+from .embedding_config import EMBEDDING_MODEL
+
+TOKENIZER_MODEL = f"sentence-transformers/{EMBEDDING_MODEL}"
+# Seconds before a failed tokenizer load is tried again; token counts are approximated meanwhile
+TOKENIZER_RETRY_SECONDS = 60.0
+
+_tokenizer = None
+_tokenizer_failed_at = None
+_tokenizer_lock = threading.Lock()
+
+
+def get_tokenizer():
+    """Process-wide tokenizer, loaded on first use; None while it can't be loaded (retried later)."""
+    global _tokenizer, _tokenizer_failed_at
+    if _tokenizer is None:
+        with _tokenizer_lock:
+            retry = _tokenizer_failed_at is None or time.monotonic() - _tokenizer_failed_at >= TOKENIZER_RETRY_SECONDS
+            if _tokenizer is None and retry:
+                try:
+                    from transformers import AutoTokenizer
+
+                    _tokenizer = AutoTokenizer.from_pretrained(TOKENIZER_MODEL)
+                    _tokenizer_failed_at = None
+                except Exception as e:
+                    _tokenizer_failed_at = time.monotonic()
+                    print(f"[WARN] Tokenizer unavailable, approximating token counts "
+                          f"(retrying in {TOKENIZER_RETRY_SECONDS:.0f}s): {e}")
+    return _tokenizer
+
+
+def warm_up_tokenizer():
+    """Load the tokenizer in a background daemon thread, so the first request doesn't wait for it."""
+    if _tokenizer is None:
+        threading.Thread(target=get_tokenizer, name="warm-up-tokenizer", daemon=True).start()
+
+
+def count_tokens(text):
+    """Token count of `text`; approximated (not cached) while the tokenizer is unavailable."""
+    if get_tokenizer() is not None:
+        return _count_exact(text)
+    return len(re.findall(r"\w+|[^\w\s]", text))
+
+
+@lru_cache(maxsize=16384)
+def _count_exact(text):
+    """Cached, since the same history turns are counted on every request."""
+    return len(get_tokenizer().encode(text, add_special_tokens=False))
+
+
+@dataclass
+class AssembledContext:
+    budget: int
+    system: str = ""
+    passages: list = field(default_factory=list)
+    recent: list = field(default_factory=list)
+    older: list = field(default_factory=list)
+    summary: str = ""
+    used: int = 0
+    # (section, number of items, tokens) left out to stay within budget
+    dropped: list = field(default_factory=list)
+
+    def format_report(self):
+        text = f"context {self.used}/{self.budget} tok"
+        if self.dropped:
+            text += " · dropped " + ", ".join(f"{n} {section} ({tokens} tok)" for section, n, tokens in self.dropped)
+        return text
+
+
+class ContextAssembler:
+    """Fills a fixed token budget by priority.
+
+    Order: the system/context text (always kept), retrieved passages in rank
+    order, recent turns newest first, then summarized older turns. Within a
+    section, items are taken until the next one doesn't fit. Kept items
+    are returned in their original order, and whatever was left out is
+    reported in `dropped`.
+    """
+
+    def __init__(self, budget_tokens=1024, count=count_tokens):
+        self.budget_tokens = budget_tokens
+        self.count = count
+
+    def _fill(self, context, section, items, newest_first=False):
+        order = range(len(items) - 1, -1, -1) if newest_first else range(len(items))
+        kept = []
+        for position, i in enumerate(order):
+            tokens = self.count(items[i])
+            if context.used + tokens > context.budget:
+                rest = [items[j] for j in list(order)[position:]]
+                context.dropped.append((section, len(rest), sum(self.count(item) for item in rest)))
+                break
+            context.used += tokens
+            kept.append(i)
+        return [items[i] for i in sorted(kept)]
+
+    def assemble(self, system, passages=(), recent=(), older=(), summary=""):
+        context = AssembledContext(budget=self.budget_tokens, system=system)
+        context.used = self.count(system)
+        context.passages = self._fill(context, "passages", list(passages))
+        context.recent = self._fill(context, "recent turns", list(recent), newest_first=True)
+        context.older = self._fill(context, "older turns", list(older))
+        if summary:
+            context.summary = "".join(self._fill(context, "summary", [summary]))
+        if context.used > context.budget:
+            print(f"[WARN] System text alone uses {context.used} of {context.budget} context tokens")
+        return context
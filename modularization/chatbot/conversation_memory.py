@@ -0,0 +1,141 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import chromadb
+import numpy as np
+
+from .exact_index import top_k_indices
+from .embedding_config import EMBEDDING_DIM
+from .retrieval import CHROMA_PATH
+
+TURNS_COLLECTION = "chat_turns"
+
+
+def turn_text(user_text, bot_text, max_chars=1000):
+    """One exchange as stored and embedded: the question plus the start of the answer."""
+    return f"User: {user_text}\nAssistant: {bot_text}"[:max_chars]
+
+
+class _SessionTurns:
+    """A session's exchanges as a growing matrix of unit vectors (capacity doubles as needed)."""
+
+    def __init__(self, dim, capacity=16):
+        self.matrix = np.zeros((capacity, dim), dtype=np.float32)
+        self.turns = []
+        self.texts = []
+
+    def append(self, turn, text, vector):
+        n = len(self.turns)
+        if n == len(self.matrix):
+            grown = np.zeros((2 * n, self.matrix.shape[1]), dtype=np.float32)
+            grown[:n] = self.matrix
+            self.matrix = grown
+        self.matrix[n] = vector
+        self.turns.append(turn)
+        self.texts.append(text)
+
+
+class ConversationMemory:
+    """Turn-level vector memory: each user/assistant exchange is one vector.
+
+    Instead of replaying a whole history, the responder asks for the few
+    earlier exchanges closest to the current question. Active sessions are
+    searched in memory (one matvec over that session's turns); every
+    exchange is also upserted into the `chat_turns` collection with
+    `session` / `turn` metadata, so a session reopened after a restart is
+    loaded from chroma_db once. Exchanges are embedded in the background.
+    """
+
+    def __init__(self, encode, path=CHROMA_PATH, collection=TURNS_COLLECTION, max_sessions=256, dim=EMBEDDING_DIM):
+        self.encode = encode
+        self.path = path
+        self.collection_name = collection
+        self.max_sessions = max_sessions
+        self.dim = dim
+        self._sessions = OrderedDict()  # session id -> _SessionTurns, least recently used first
+        self._client = None
+        self._collection = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="conversation-memory")
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            with self._lock:
+                if self._collection is None:
+                    self._client = chromadb.PersistentClient(path=self.path)
+                    self._collection = self._client.get_or_create_collection(
+                        self.collection_name, metadata={"hnsw:space": "cosine"}
+                    )
+        return self._collection
+
+    def _session(self, session_id):
+        """In-memory turns of a session, loading them from the collection on first use."""
+        with self._lock:
+            turns = self._sessions.get(session_id)
+            if turns is not None:
+                self._sessions.move_to_end(session_id)
+                return turns
+        turns = _SessionTurns(self.dim)
+        try:
+            records = self.collection.get(where={"session": session_id}, include=["embeddings", "documents", "metadatas"])
+            rows = sorted(zip(records["metadatas"], records["documents"], records["embeddings"]), key=lambda r: r[0]["turn"])
+            for metadata, document, embedding in rows:
+                turns.append(metadata["turn"], document, self._unit(embedding))
+        except Exception as e:
+            print("[WARN] Could not load conversation memory for", session_id, ":", e)
+        with self._lock:
+            turns = self._sessions.setdefault(session_id, turns)
+            if len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return turns
+
+    @staticmethod
+    def _unit(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def add(self, session_id, turn, user_text, bot_text):
+        """Embed and store one exchange in the background; returns the Future."""
+        return self._executor.submit(self._add, session_id, turn, turn_text(user_text, bot_text))
+
+    def _add(self, session_id, turn, text):
+        vector = self._unit(self.encode([text], normalize_embeddings=True)[0])
+        turns = self._session(session_id)
+        with self._lock:
+            turns.append(turn, text, vector)
+        self.collection.upsert(
+            ids=[f"{session_id}:{turn:06d}"],
+            embeddings=[vector.tolist()],
+            documents=[text],
+            metadatas=[{"session": session_id, "turn": turn}],
+        )
+
+    def relevant(self, session_id, query_embedding, k=3, before_turn=None, min_score=0.3):
+        """Return up to k (turn, text, similarity) of the session's earlier exchanges, in turn order.
+
+        `before_turn` excludes exchanges from that turn on (e.g. the ones
+        already included verbatim as recent history).
+        """
+        if not session_id:
+            return []
+        turns = self._session(session_id)
+        with self._lock:
+            n = len(turns.turns)
+            if before_turn is not None:
+                n = sum(1 for turn in turns.turns if turn < before_turn)
+            if not n:
+                return []
+            similarities = turns.matrix[:n] @ self._unit(query_embedding)
+            hits = [
+                (turns.turns[i], turns.texts[i], float(similarities[i]))
+                for i in top_k_indices(similarities, k)
+                if similarities[i] >= min_score
+            ]
+        return sorted(hits)
+
+    def forget(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+        self._executor.submit(self.collection.delete, where={"session": session_id})
@@ -0,0 +1,171 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .embedding_config import EMBEDDING_MODEL, EMBEDDING_DIM
+
+
+def normalize_query(text):
+    """Case- and whitespace-insensitive form of a query used as the cache key."""
+    return " ".join(str(text).lower().split())
+
+
+def cache_key(text, model_name, normalize_embeddings=False, **options):
+    """Key of one text's vector; other encode options (batch_size, precision...) are part of it."""
+    raw = f"{model_name}\0{int(bool(normalize_embeddings))}\0{normalize_query(text)}"
+    if options:  # keys without options stay as they were, so existing disk stores keep matching
+        raw += "\0" + repr(sorted(options.items()))
+    return hashlib.sha1(raw.encode("utf-8")).digest()
+
+
+class DiskEmbeddingStore:
+    """Fixed-capacity ring of vectors in memory-mapped files that survives restarts.
+
+    Layout in `path`: keys.u8 (capacity x 20 sha1 digests), vectors.f32
+    (capacity x dim) and meta.i64 ([next_row, dim]). Once full, the oldest
+    row is overwritten.
+    """
+
+    KEY_BYTES = 20
+
+    def __init__(self, path, dim=EMBEDDING_DIM, capacity=100_000):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.dim = dim
+        self.capacity = capacity
+        exists = os.path.exists(os.path.join(path, "meta.i64"))
+        mode = "r+" if exists else "w+"
+        self._meta = np.memmap(os.path.join(path, "meta.i64"), dtype=np.int64, mode=mode, shape=(2,))
+        if exists and int(self._meta[1]) != dim:
+            raise ValueError(f"Embedding store at {path} has dim {int(self._meta[1])}, expected {dim}")
+        self._meta[1] = dim
+        self._keys = np.memmap(
+            os.path.join(path, "keys.u8"), dtype=np.uint8, mode=mode, shape=(capacity, self.KEY_BYTES)
+        )
+        self._vectors = np.memmap(
+            os.path.join(path, "vectors.f32"), dtype=np.float32, mode=mode, shape=(capacity, dim)
+        )
+        self._rows = {}
+        for row in np.flatnonzero(self._keys.any(axis=1)):
+            self._rows[self._keys[row].tobytes()] = int(row)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def get(self, key):
+        row = self._rows.get(key)
+        if row is None:
+            return None
+        return np.array(self._vectors[row])
+
+    def put(self, key, vector):
+        if key in self._rows:
+            return
+        row = int(self._meta[0]) % self.capacity
+        old_key = self._keys[row].tobytes()
+        if self._rows.get(old_key) == row:
+            del self._rows[old_key]
+        # Vector before key so a torn write never exposes a key with a stale vector
+        self._vectors[row] = vector
+        self._keys[row] = np.frombuffer(key, dtype=np.uint8)
+        self._rows[key] = row
+        self._meta[0] = row + 1
+
+    def flush(self):
+        self._vectors.flush()
+        self._keys.flush()
+        self._meta.flush()
+
+
+class EmbeddingCache:
+    """Bounded query-embedding cache in front of an encode function.
+
+    `encode` keeps the SentenceTransformer.encode signature, so the cache can
+    be dropped in wherever the model's encode was used. Lookups go through an
+    in-memory LRU, then the optional on-disk tier, and only misses reach the
+    model (as one batch).
+    """
+
+    def __init__(self, encode, model_name=EMBEDDING_MODEL, max_entries=4096,
+                 disk_path=None, disk_capacity=100_000, dim=EMBEDDING_DIM):
+        self._encode = encode
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.dim = dim
+        self.disk = DiskEmbeddingStore(disk_path, dim, disk_capacity) if disk_path else None
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _lookup(self, key):
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return vector
+            if self.disk is not None:
+                vector = self.disk.get(key)
+                if vector is not None:
+                    self.disk_hits += 1
+                    self._remember(key, vector)
+                    return vector
+            self.misses += 1
+            return None
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def encode(self, sentences, normalize_embeddings=False, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.empty((0, self.dim), dtype=np.float32)
+        keys = [cache_key(text, self.model_name, normalize_embeddings, **kwargs) for text in texts]
+
+        vectors = [self._lookup(key) for key in keys]
+        missing = {}
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(keys[i], []).append(i)
+
+        if missing:
+            first_index = [indices[0] for indices in missing.values()]
+            encoded = self._encode(
+                [texts[i] for i in first_index], normalize_embeddings=normalize_embeddings, **kwargs
+            )
+            encoded = np.asarray(encoded, dtype=np.float32)
+            with self._lock:
+                for (key, indices), vector in zip(missing.items(), encoded):
+                    self._remember(key, vector)
+                    if self.disk is not None:
+                        self.disk.put(key, vector)
+                    for i in indices:
+                        vectors[i] = vector
+
+        return vectors[0].copy() if single else np.stack(vectors)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_entries": len(self.disk) if self.disk is not None else 0,
+            }
+
+    def flush(self):
+        if self.disk is not None:
+            with self._lock:
+                self.disk.flush()
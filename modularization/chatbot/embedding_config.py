@@ -0,0 +1,4 @@
+# Model the chroma_db collections were embedded with. Kept free of imports so
+# caches and the model provider can use them without pulling in chromadb.
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+EMBEDDING_DIM = 384
@@ -0,0 +1,167 @@
+import os
+import math
+import time
+import atexit
+import threading
+import multiprocessing as mp
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from .model_provider import DEFAULT_BACKEND, load_model
+from .embedding_config import EMBEDDING_MODEL, EMBEDDING_DIM
+
+# Seconds a batch may take before the pool is considered stuck (a worker died
+# mid-task, or its model failed to load) and is restarted
+ENCODE_TIMEOUT = 120.0
+
+# === Worker-process side ===
+_worker_model = None
+_worker_shm = None  # the parent's output block, attached once and kept until it is replaced
+
+
+def _init_worker(model_name, backend, torch_threads):
+    """Load the model once per worker and keep torch from oversubscribing cores."""
+    global _worker_model
+    try:
+        import torch
+        torch.set_num_threads(torch_threads)
+    except ImportError:
+        pass
+    _worker_model = load_model(model_name, backend)
+
+
+def _attach(name):
+    """Attach to a parent-owned block; the parent alone unlinks it.
+
+    Before Python 3.13 attaching also registers the block with the resource
+    tracker. Workers share the parent's tracker (EmbeddingPool.start makes
+    sure it runs before spawning), which keeps one entry per name: the
+    worker's registration is a no-op and the parent's unlink() clears it.
+    Unregistering here would remove the parent's entry instead.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+def _encode_into(shm_name, row_offset, dim, texts, normalize_embeddings):
+    """Encode `texts` straight into rows [row_offset, row_offset + len(texts)) of the shared buffer."""
+    global _worker_shm
+    if _worker_shm is None or _worker_shm.name.lstrip("/") != shm_name.lstrip("/"):
+        if _worker_shm is not None:
+            _worker_shm.close()  # the parent grew the block; the old one is gone
+        _worker_shm = _attach(shm_name)
+    out = np.ndarray((len(texts), dim), dtype=np.float32, buffer=_worker_shm.buf, offset=row_offset * dim * 4)
+    out[:] = _worker_model.encode(texts, normalize_embeddings=normalize_embeddings)
+    del out
+    return len(texts)
+
+
+# === App side ===
+class EmbeddingPool:
+    """Runs the encoder in a pool of worker processes.
+
+    Embedding work no longer holds the GIL of the Gradio process, so light
+    UI handlers (load_chat, rename_chat, create_session_html) stay responsive
+    while documents are being embedded. Texts go to the workers pickled,
+    vectors come back through a shared-memory block the workers write into.
+    Each call is split evenly over the workers (at most `chunk_size` texts
+    per slice), so a scheduler batch keeps every process busy.
+
+    The output block is reused across calls and only replaced when a larger
+    batch arrives; calls are therefore serialized (the embedding scheduler's
+    single dispatcher is the usual caller). A batch that takes longer than
+    `timeout` seconds raises TimeoutError and the pool is restarted.
+    """
+
+    def __init__(self, model_name=EMBEDDING_MODEL, processes=2, chunk_size=64, dim=EMBEDDING_DIM,
+                 backend=DEFAULT_BACKEND, timeout=ENCODE_TIMEOUT):
+        self.model_name = model_name
+        self.backend = backend
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self.dim = dim
+        self.timeout = timeout
+        self._pool = None
+        self._shm = None
+        self._lock = threading.Lock()
+        self._encode_lock = threading.Lock()
+
+    def start(self):
+        """Spawn the workers (each loads its own copy of the model)."""
+        with self._lock:
+            if self._pool is None:
+                # Spawned workers inherit a tracker only if it is already running
+                resource_tracker.ensure_running()
+                torch_threads = max(1, (os.cpu_count() or 1) // self.processes)
+                self._pool = mp.get_context("spawn").Pool(
+                    self.processes, initializer=_init_worker, initargs=(self.model_name, self.backend, torch_threads)
+                )
+                atexit.register(self.close)
+        return self._pool
+
+    def _buffer(self, rows):
+        """The shared output block, grown (replaced) when `rows` do not fit. Caller holds _encode_lock."""
+        size = rows * self.dim * 4
+        if self._shm is None or self._shm.size < size:
+            if self._shm is not None:
+                self._shm.close()
+                self._shm.unlink()
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+        return self._shm
+
+    def encode(self, sentences, normalize_embeddings=False):
+        """Drop-in for SentenceTransformer.encode backed by the worker pool."""
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.empty((0, self.dim), dtype=np.float32)
+
+        pool = self.start()
+        chunk = min(self.chunk_size, math.ceil(len(texts) / self.processes))
+        with self._encode_lock:
+            shm = self._buffer(len(texts))
+            jobs = [
+                pool.apply_async(
+                    _encode_into, (shm.name, start, self.dim, texts[start:start + chunk], normalize_embeddings)
+                )
+                for start in range(0, len(texts), chunk)
+            ]
+            deadline = time.monotonic() + self.timeout
+            try:
+                for job in jobs:
+                    job.get(max(deadline - time.monotonic(), 0))  # waits without holding the GIL
+            except mp.TimeoutError:
+                print(f"[WARN] Embedding pool did not answer within {self.timeout:.0f} s, restarting it")
+                self._reset()
+                raise TimeoutError(f"embedding batch of {len(texts)} texts timed out") from None
+            # Copied out: the block is overwritten by the next call
+            shared = np.ndarray((len(texts), self.dim), dtype=np.float32, buffer=shm.buf)
+            vectors = shared.copy()
+            del shared
+        return vectors[0] if single else vectors
+
+    def _reset(self):
+        """Drop a stuck pool (its tasks are lost) and the block its workers may still write to."""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.terminate()
+                self._pool = None
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool.join()
+                self._pool = None
+        with self._encode_lock:
+            if self._shm is not None:
+                self._shm.close()
+                self._shm.unlink()
+                self._shm = None
@@ -0,0 +1,106 @@
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+
+from .embedding_config import EMBEDDING_DIM
+
+
+class EmbeddingScheduler:
+    """Coalesces concurrent encode calls into batched forward passes.
+
+    Every Gradio event runs on its own worker thread; instead of each one
+    calling the model with a single query, callers enqueue their texts and a
+    dispatcher thread runs them together. A request that arrives while the
+    dispatcher is idle and alone is encoded immediately, so a single user
+    never waits on the window; once several requests are queued, the batch
+    keeps collecting for up to `max_wait_ms` or `max_batch_size` items.
+    """
+
+    def __init__(self, encode, max_batch_size=32, max_wait_ms=5.0):
+        self._encode = encode
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="embedding-scheduler", daemon=True)
+                    self._thread.start()
+
+    def submit(self, text, normalize_embeddings=False, **kwargs):
+        """Queue one text; the returned Future resolves to its embedding vector.
+
+        Texts are only batched with others encoded with the same options.
+        """
+        self._ensure_started()
+        future = Future()
+        options = dict(kwargs, normalize_embeddings=bool(normalize_embeddings))
+        self._queue.put((text, repr(sorted(options.items())), options, future))
+        return future
+
+    def encode(self, sentences, normalize_embeddings=False, **kwargs):
+        """Drop-in for SentenceTransformer.encode that goes through the scheduler."""
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        futures = [self.submit(text, normalize_embeddings, **kwargs) for text in texts]
+        vectors = [future.result() for future in futures]
+        if single:
+            return vectors[0]
+        return np.stack(vectors) if vectors else np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        # Drain whatever is already waiting; only hold the window open under concurrency
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if len(batch) > 1:
+            deadline = time.perf_counter() + self.max_wait_ms / 1000
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            groups = {}
+            for item in batch:
+                groups.setdefault(item[1], []).append(item)
+            for group in groups.values():
+                options = group[0][2]
+                try:
+                    vectors = self._encode([text for text, _, _, _ in group], **options)
+                    if len(vectors) != len(group):
+                        raise RuntimeError(f"encode returned {len(vectors)} vectors for {len(group)} texts")
+                except Exception as e:
+                    for _, _, _, future in group:
+                        future.set_exception(e)
+                    continue
+                for (_, _, _, future), vector in zip(group, vectors):
+                    future.set_result(np.asarray(vector, dtype=np.float32))
+            self.batches += 1
+            self.items += len(batch)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+        }
@@ -0,0 +1,83 @@
+"""Compare encoder backends on a fixed corpus.
+
+Reports sentences/sec and cosine-similarity drift against the PyTorch fp32
+reference for each backend in model_provider.BACKENDS.
+
+    python -m chatbot.encoder_benchmark --repeat 8 --batch-size 32
+"""
+import argparse
+import time
+
+import numpy as np
+
+from .model_provider import BACKENDS, load_model
+from .embedding_config import EMBEDDING_MODEL
+
+# Fixed corpus: short chat queries and longer passages across the RAG contexts
+CORPUS = [
+    "hi",
+    "hello there!",
+    "What is photosynthesis?",
+    "Explain the theory of general relativity in simple terms.",
+    "How do vaccines train the immune system?",
+    "What causes the seasons on Earth?",
+    "Why is the sky blue during the day and red at sunset?",
+    "Who was the first emperor of Rome?",
+    "What were the main causes of World War I?",
+    "Summarize the fall of the Berlin Wall in 1989.",
+    "How did the printing press change Europe?",
+    "What is a transformer model in machine learning?",
+    "How does HTTPS keep web traffic private?",
+    "Error code ECONNRESET when calling the API, what does it mean?",
+    "Compare SQLite WAL mode with the rollback journal.",
+    "What is the difference between RAM and storage?",
+    "The mitochondria is the powerhouse of the cell, producing ATP through oxidative phosphorylation.",
+    "Newton's three laws of motion describe the relationship between a body and the forces acting upon it.",
+    "The Industrial Revolution began in Britain in the late 18th century and spread to Europe and North America.",
+    "The Magna Carta, sealed in 1215, limited the power of the English king and influenced later constitutions.",
+    "Large language models are trained on vast text corpora to predict the next token in a sequence.",
+    "Vector databases index embeddings with approximate nearest-neighbour structures such as HNSW graphs.",
+    "Quantum computers use qubits, which can exist in superpositions of 0 and 1, to solve certain problems faster.",
+    "The Renaissance was a period of cultural rebirth in Europe between the 14th and 17th centuries.",
+]
+
+
+def benchmark(backend, sentences, batch_size, reference=None):
+    model = load_model(EMBEDDING_MODEL, backend)
+    model.encode(sentences[:batch_size], batch_size=batch_size)  # warm-up
+
+    start = time.perf_counter()
+    vectors = model.encode(sentences, batch_size=batch_size, normalize_embeddings=True)
+    elapsed = time.perf_counter() - start
+
+    row = {"backend": backend, "sentences_per_sec": len(sentences) / elapsed}
+    if reference is not None:
+        cosine = np.sum(vectors * reference, axis=1)  # both sides are unit-normalized
+        row["mean_cosine"] = float(cosine.mean())
+        row["min_cosine"] = float(cosine.min())
+    return row, vectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--repeat", type=int, default=8, help="copies of the corpus to encode")
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    sentences = CORPUS * args.repeat
+    # fp32 always runs first: it is the drift reference
+    backends = ["torch"] + [b for b in args.backends if b != "torch"]
+
+    reference = None
+    print(f"{'backend':<8} {'sent/s':>10} {'mean cos':>10} {'min cos':>10}")
+    for backend in backends:
+        row, vectors = benchmark(backend, sentences, args.batch_size, reference)
+        if reference is None:
+            reference = vectors
+            row["mean_cosine"] = row["min_cosine"] = 1.0
+        print(f"{backend:<8} {row['sentences_per_sec']:>10.1f} {row['mean_cosine']:>10.5f} {row['min_cosine']:>10.5f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import numpy as np
+
+
+def top_k_indices(scores, k):
+    """Indices of the k largest scores, best first (argpartition + sort of k items)."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+class ExactIndex:
+    """Brute-force cosine search over a small collection held as one NumPy matrix.
+
+    For a few thousand 384-d vectors a single matmul is faster than walking
+    the HNSW graph and the results are exact. Distances are reported in the
+    collection's space so they line up with what chroma returns.
+    """
+
+    def __init__(self, ids, documents, embeddings, space="l2"):
+        self.ids = list(ids)
+        self.documents = list(documents) if documents is not None else [None] * len(self.ids)
+        matrix = np.asarray(embeddings, dtype=np.float32).reshape(len(self.ids), -1)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        self.matrix = matrix / np.maximum(norms, 1e-12)
+        self.space = space
+        self._rows = {doc_id: i for i, doc_id in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _distance(self, similarity):
+        # Unit vectors: squared L2 = 2 - 2cos; cosine / ip distance = 1 - cos
+        return 2.0 - 2.0 * similarity if self.space == "l2" else 1.0 - similarity
+
+    def vectors(self, ids):
+        """Unit vectors for `ids` (None for ids not in the index)."""
+        return [self.matrix[self._rows[doc_id]] if doc_id in self._rows else None for doc_id in ids]
+
+    def search(self, query_vector, k):
+        """Return (id, document, distance) for the k nearest vectors."""
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        similarities = self.matrix @ query
+        return [
+            (self.ids[i], self.documents[i], float(self._distance(similarities[i])))
+            for i in top_k_indices(similarities, k)
+        ]
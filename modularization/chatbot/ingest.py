@@ -0,0 +1,458 @@
+"""Stream a folder of documents into a chroma_db collection.
+
+    python -m chatbot.ingest knowledge/science --context Science
+    python -m chatbot.ingest docs/ --collection technology --workers 2
+    python -m chatbot.ingest knowledge/science --context Science --watch
+
+Files are chunked as they are read, chunks are embedded in length-sorted
+batches and upserted into the collection. Progress is checkpointed per file
+in a small SQLite state database, so an interrupted run resumes where it
+stopped, and chunks already in the collection are never re-embedded. A
+chunk's id is its content hash plus its file, so every chunk keeps the
+`source` it came from. Files changed or deleted since the last run have
+their old chunks diffed out the same way --watch does. Memory is bounded by
+--buffer chunks regardless of the corpus size.
+
+With --watch the folder is then polled for added, changed and deleted files;
+only those files are re-chunked, and their chunk hashes are diffed against
+the checkpoint so the collection receives the minimal upserts and deletes.
+
+A running app keeps chroma's HNSW segments in memory as first loaded, so it
+searches re-ingested collections as they are now only after it publishes a
+new index generation. After a run (and after every --watch pass that
+changed something) the app's --manifest is touched, which makes its
+ManifestWatcher publish; until then only exact/BM25 search sees the changes.
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import argparse
+
+import chromadb
+
+from . import model_provider
+from .embedding_config import EMBEDDING_MODEL
+from .retrieval import CHROMA_PATH, collection_name
+
+TEXT_EXTENSIONS = (".txt", ".md", ".rst", ".csv", ".json", ".html")
+STATE_FILE = "ingest_state.sqlite3"
+# Manifest the app polls (idk.KB_MANIFEST); touching it publishes a new index generation
+KB_MANIFEST = "knowledge_base.json"
+# 1: chunk id = content hash; 2: content hash + source (see chunk_id)
+CHUNK_ID_VERSION = 2
+
+
+def content_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def chunk_id(source, chunk_hash):
+    """Id of one file's chunk: identical text in two files is two chunks, each with its own source."""
+    return f"{chunk_hash}-{content_hash(source)[:12]}"
+
+
+def iter_files(root, extensions=TEXT_EXTENSIONS):
+    """Yield document paths under `root` in a stable order."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for filename in sorted(filenames):
+            if filename.lower().endswith(extensions):
+                yield os.path.join(dirpath, filename)
+
+
+def iter_chunks(path, chunk_chars=1000):
+    """Stream a file into chunks of about `chunk_chars`, breaking at blank lines where possible."""
+    parts, size = [], 0
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            if not line.strip():
+                if size >= chunk_chars // 2:
+                    yield "".join(parts).strip()
+                    parts, size = [], 0
+                continue
+            while size + len(line) > chunk_chars:
+                cut = chunk_chars - size
+                parts.append(line[:cut])
+                yield "".join(parts).strip()
+                parts, size, line = [], 0, line[cut:]
+            parts.append(line)
+            size += len(line)
+    if parts and "".join(parts).strip():
+        yield "".join(parts).strip()
+
+
+class IngestState:
+    """Per-collection checkpoint of fully ingested files and the chunk hashes each produced."""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                collection TEXT NOT NULL, path TEXT NOT NULL,
+                mtime REAL NOT NULL, size INTEGER NOT NULL,
+                PRIMARY KEY (collection, path)
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                collection TEXT NOT NULL, path TEXT NOT NULL, hash TEXT NOT NULL,
+                PRIMARY KEY (collection, path, hash)
+            );
+            CREATE TABLE IF NOT EXISTS versions (
+                collection TEXT PRIMARY KEY, chunk_ids INTEGER NOT NULL
+            );
+            """
+        )
+
+    def chunk_id_version(self, collection):
+        """Chunk id scheme the collection was ingested with (1 if it predates the versions table)."""
+        row = self.conn.execute("SELECT chunk_ids FROM versions WHERE collection = ?", (collection,)).fetchone()
+        if row is not None:
+            return row[0]
+        return 1 if self.files(collection) else CHUNK_ID_VERSION
+
+    def set_chunk_id_version(self, collection, version):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO versions (collection, chunk_ids) VALUES (?, ?)", (collection, version)
+            )
+
+    def is_done(self, collection, path, stat):
+        row = self.conn.execute(
+            "SELECT mtime, size FROM files WHERE collection = ? AND path = ?", (collection, path)
+        ).fetchone()
+        return row is not None and row[0] == stat.st_mtime and row[1] == stat.st_size
+
+    def mark_done(self, collection, path, stat, hashes):
+        with self.conn:
+            self.conn.execute("DELETE FROM chunks WHERE collection = ? AND path = ?", (collection, path))
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO chunks (collection, path, hash) VALUES (?, ?, ?)",
+                ((collection, path, h) for h in hashes),
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO files (collection, path, mtime, size) VALUES (?, ?, ?, ?)",
+                (collection, path, stat.st_mtime, stat.st_size),
+            )
+
+    def files(self, collection):
+        """{path: (mtime, size)} of every checkpointed file in the collection."""
+        rows = self.conn.execute("SELECT path, mtime, size FROM files WHERE collection = ?", (collection,))
+        return {path: (mtime, size) for path, mtime, size in rows}
+
+    def chunk_hashes(self, collection, path):
+        rows = self.conn.execute("SELECT hash FROM chunks WHERE collection = ? AND path = ?", (collection, path))
+        return {row[0] for row in rows}
+
+    def all_chunk_hashes(self, collection):
+        rows = self.conn.execute("SELECT DISTINCT hash FROM chunks WHERE collection = ?", (collection,))
+        return {row[0] for row in rows}
+
+    def forget(self, collection, path):
+        with self.conn:
+            self.conn.execute("DELETE FROM chunks WHERE collection = ? AND path = ?", (collection, path))
+            self.conn.execute("DELETE FROM files WHERE collection = ? AND path = ?", (collection, path))
+
+    def close(self):
+        self.conn.close()
+
+
+class Ingestor:
+    """Embeds chunks in length-sorted batches and upserts them into one collection."""
+
+    def __init__(self, collection, encode, batch_size=64, buffer_size=1024):
+        self.collection = collection
+        self.encode = encode
+        self.batch_size = batch_size
+        self.buffer_size = buffer_size
+        self._buffer = []
+        self.flushes = 0
+        self.embedded = 0
+        self.skipped = 0
+
+    def add(self, chunk_id, text, metadata):
+        self._buffer.append((chunk_id, text, metadata))
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """Embed and upsert everything buffered; chunks already in the collection are skipped.
+
+        Identical text queued for several files is embedded once per flush.
+        """
+        if not self._buffer:
+            return
+        buffered, self._buffer = self._buffer, []
+        self.flushes += 1
+        unique = {chunk_id: (chunk_id, text, metadata) for chunk_id, text, metadata in buffered}
+        existing = set(self.collection.get(ids=list(unique), include=[])["ids"])
+        pending = [item for chunk_id, item in unique.items() if chunk_id not in existing]
+        self.skipped += len(buffered) - len(pending)
+        by_text = {}
+        for item in pending:
+            by_text.setdefault(item[1], []).append(item)
+
+        # Similar lengths per batch keep padding (and wasted compute) low
+        texts = sorted(by_text, key=len)
+        for start in range(0, len(texts), self.batch_size):
+            batch_texts = texts[start:start + self.batch_size]
+            vectors = self.encode(batch_texts, normalize_embeddings=True, batch_size=self.batch_size)
+            batch = [(item, vector) for text, vector in zip(batch_texts, vectors) for item in by_text[text]]
+            self.collection.upsert(
+                ids=[chunk_id for (chunk_id, _, _), _ in batch],
+                documents=[text for (_, text, _), _ in batch],
+                embeddings=[list(map(float, vector)) for _, vector in batch],
+                metadatas=[metadata for (_, _, metadata), _ in batch],
+            )
+            self.embedded += len(batch_texts)
+
+
+def ingest_file(ingestor, root, path, chunk_chars):
+    """Queue one file's chunks; returns the content hashes it produced."""
+    source = os.path.relpath(path, root)
+    hashes = []
+    for index, text in enumerate(iter_chunks(path, chunk_chars)):
+        if not text:
+            continue
+        chunk_hash = content_hash(text)
+        hashes.append(chunk_hash)
+        ingestor.add(chunk_id(source, chunk_hash), text, {"source": source, "chunk": index, "content_hash": chunk_hash})
+    return hashes
+
+
+def delete_chunks(collection, source, hashes, keep=()):
+    """Delete `source`'s chunks for `hashes`, except those in `keep`."""
+    stale = sorted(set(hashes) - set(keep))
+    if stale:
+        collection.delete(ids=[chunk_id(source, chunk_hash) for chunk_hash in stale])
+    return len(stale)
+
+
+def checkpoint_files(collection, state, name, items):
+    """Record (source, stat, hashes) files whose chunks are all in the collection; returns chunks deleted.
+
+    Chunks a re-ingested file no longer produces are deleted first, so an
+    interrupted run re-ingests the file on the next start instead of
+    leaving untracked chunks behind.
+    """
+    removed = 0
+    for source, _, hashes in items:
+        removed += delete_chunks(collection, source, state.chunk_hashes(name, source), hashes)
+    for item in items:
+        state.mark_done(name, *item)
+    return removed
+
+
+def forget_file(collection, state, name, source):
+    """Drop a checkpointed file that is gone from disk, with the chunks only it produced."""
+    removed = delete_chunks(collection, source, state.chunk_hashes(name, source))
+    state.forget(name, source)
+    return removed
+
+
+def migrate_chunk_ids(collection, state, name):
+    """Re-ingest a collection stored with bare content-hash ids (CHUNK_ID_VERSION 1).
+
+    Those ids were shared between files, so the old chunks are deleted and
+    every checkpoint dropped; the run that follows re-ingests the folder.
+    """
+    if state.chunk_id_version(name) >= CHUNK_ID_VERSION:
+        state.set_chunk_id_version(name, CHUNK_ID_VERSION)  # recorded for collections ingested from now on
+        return
+    legacy = sorted(state.all_chunk_hashes(name))
+    for start in range(0, len(legacy), 500):
+        collection.delete(ids=legacy[start:start + 500])
+    for source in state.files(name):
+        state.forget(name, source)
+    state.set_chunk_id_version(name, CHUNK_ID_VERSION)
+    print(f"[DEBUG] {name}: {len(legacy)} chunks with content-hash ids dropped, re-ingesting with per-file ids")
+
+
+def touch_manifest(path):
+    """Bump the app's manifest mtime so its ManifestWatcher publishes the updated store."""
+    if not path:
+        return
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        print(f"[WARN] Manifest {path} not found; the app searches the changes only after its next publish")
+        return
+    print(f"[DEBUG] Touched {path}; the app publishes a new index generation on its next poll")
+
+
+def open_collection(name, path=CHROMA_PATH):
+    client = chromadb.PersistentClient(path=path)
+    return client.get_or_create_collection(name, metadata={"hnsw:space": "cosine"})
+
+
+def build_encoder(workers=0, backend=model_provider.DEFAULT_BACKEND):
+    if workers:
+        from .embedding_pool import EmbeddingPool
+
+        pool = EmbeddingPool(EMBEDDING_MODEL, processes=workers, backend=backend)
+        return lambda texts, normalize_embeddings=True, batch_size=None: pool.encode(texts, normalize_embeddings)
+    return lambda texts, **kwargs: model_provider.encode(texts, backend=backend, **kwargs)
+
+
+def ingest_folder(root, name, encode, chroma_path=CHROMA_PATH, chunk_chars=1000, batch_size=64, buffer_size=1024):
+    collection = open_collection(name, chroma_path)
+    state = IngestState(os.path.join(chroma_path, STATE_FILE))
+    migrate_chunk_ids(collection, state, name)
+    ingestor = Ingestor(collection, encode, batch_size, buffer_size)
+    start = time.perf_counter()
+    files = done = removed = 0
+    seen = set()
+    # Files whose chunks may still be sitting in the buffer; they are checkpointed
+    # only after a flush has put every one of their chunks in the collection
+    pending = []
+    try:
+        for path in iter_files(root):
+            files += 1
+            source = os.path.relpath(path, root)
+            seen.add(source)
+            stat = os.stat(path)
+            if state.is_done(name, source, stat):
+                continue
+            flushes = ingestor.flushes
+            hashes = ingest_file(ingestor, root, path, chunk_chars)
+            if ingestor.flushes != flushes:
+                removed += checkpoint_files(collection, state, name, pending)
+                pending = []
+            pending.append((source, stat, hashes))
+            done += 1
+            print(f"[DEBUG] Queued {source}: {len(hashes)} chunks")
+        ingestor.flush()
+        removed += checkpoint_files(collection, state, name, pending)
+        # Files deleted while nothing was watching the folder
+        for source in state.files(name):
+            if source not in seen:
+                removed += forget_file(collection, state, name, source)
+                print(f"[DEBUG] Removed {source}")
+    finally:
+        state.close()
+    elapsed = time.perf_counter() - start
+    print(
+        f"[DEBUG] {name}: {done}/{files} files ingested, {ingestor.embedded} chunks embedded, "
+        f"{ingestor.skipped} already indexed, {removed} stale chunks deleted, {elapsed:.1f}s"
+    )
+    return ingestor
+
+
+class FolderWatcher:
+    """Keeps a collection in sync with a folder by polling file mtimes and sizes.
+
+    An idle pass is one scandir walk plus one state query, so polling every
+    couple of seconds costs next to no CPU. A changed file is re-chunked on
+    its own: chunks with new hashes are upserted, hashes it no longer
+    produces are deleted. After a pass that changed anything, `manifest` is
+    touched so a running app publishes the new state.
+    """
+
+    def __init__(self, root, name, encode, chroma_path=CHROMA_PATH, chunk_chars=1000, batch_size=64,
+                 manifest=None):
+        self.root = root
+        self.name = name
+        self.chunk_chars = chunk_chars
+        self.manifest = manifest
+        self.collection = open_collection(name, chroma_path)
+        self.state = IngestState(os.path.join(chroma_path, STATE_FILE))
+        migrate_chunk_ids(self.collection, self.state, name)
+        self.ingestor = Ingestor(self.collection, encode, batch_size)
+
+    def scan(self):
+        """Return (changed, deleted): on-disk paths needing a re-sync and checkpointed sources gone from disk."""
+        known = self.state.files(self.name)
+        changed, seen = [], set()
+        for path in iter_files(self.root):
+            source = os.path.relpath(path, self.root)
+            seen.add(source)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if known.get(source) != (stat.st_mtime, stat.st_size):
+                changed.append(path)
+        deleted = [source for source in known if source not in seen]
+        return changed, deleted
+
+    def sync_file(self, path):
+        source = os.path.relpath(path, self.root)
+        stat = os.stat(path)
+        old = self.state.chunk_hashes(self.name, source)
+        new = []
+        for index, text in enumerate(iter_chunks(path, self.chunk_chars)):
+            if not text:
+                continue
+            chunk_hash = content_hash(text)
+            new.append(chunk_hash)
+            if chunk_hash not in old:
+                self.ingestor.add(
+                    chunk_id(source, chunk_hash), text, {"source": source, "chunk": index, "content_hash": chunk_hash}
+                )
+        self.ingestor.flush()
+        removed = checkpoint_files(self.collection, self.state, self.name, [(source, stat, new)])
+        print(f"[DEBUG] Re-indexed {source}: {len(set(new) - old)} new chunks, {removed} deleted")
+
+    def remove_file(self, source):
+        removed = forget_file(self.collection, self.state, self.name, source)
+        print(f"[DEBUG] Removed {source}: {removed} chunks deleted")
+
+    def run_once(self):
+        changed, deleted = self.scan()
+        for path in changed:
+            try:
+                self.sync_file(path)
+            except FileNotFoundError:
+                continue  # deleted between scan and sync; the next pass forgets it
+        for source in deleted:
+            self.remove_file(source)
+        if changed or deleted:
+            touch_manifest(self.manifest)
+        return len(changed) + len(deleted)
+
+    def watch(self, interval=2.0):
+        print(f"[DEBUG] Watching {self.root} -> {self.name} every {interval}s")
+        try:
+            while True:
+                self.run_once()
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.state.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest a folder of documents into chroma_db.")
+    parser.add_argument("folder")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--context", help="context selector value, e.g. Science")
+    target.add_argument("--collection", help="explicit collection name")
+    parser.add_argument("--chroma-path", default=CHROMA_PATH)
+    parser.add_argument("--chunk-chars", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--buffer", type=int, default=1024, help="chunks held in memory before embedding")
+    parser.add_argument("--workers", type=int, default=0, help="embedding worker processes (0 = in-process)")
+    parser.add_argument("--backend", default=model_provider.DEFAULT_BACKEND, choices=model_provider.BACKENDS)
+    parser.add_argument("--watch", action="store_true", help="keep the collection in sync with the folder")
+    parser.add_argument("--interval", type=float, default=2.0, help="seconds between polls in --watch mode")
+    parser.add_argument(
+        "--manifest", default=KB_MANIFEST, help="app manifest to touch after changes ('' to leave the app alone)"
+    )
+    args = parser.parse_args()
+
+    name = args.collection or collection_name(args.context)
+    encode = build_encoder(args.workers, args.backend)
+    ingest_folder(
+        args.folder, name, encode, args.chroma_path, args.chunk_chars, args.batch_size, args.buffer,
+    )
+    touch_manifest(args.manifest)
+    if args.watch:
+        FolderWatcher(
+            args.folder, name, encode, args.chroma_path, args.chunk_chars, args.batch_size, args.manifest
+        ).watch(args.interval)
+
+
+if __name__ == "__main__":
+    main()
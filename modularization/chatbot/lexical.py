@@ -0,0 +1,65 @@
+import os
+import re
+import sqlite3
+import threading
+
+# chroma keeps every document in an FTS5 table (trigram tokenizer) whose rowid
+# is embeddings.id, so BM25 runs against the same store as the HNSW segment.
+BM25_SQL = """
+SELECT e.embedding_id, fts.string_value, bm25(embedding_fulltext_search) AS score
+FROM embedding_fulltext_search AS fts
+JOIN embeddings AS e ON e.id = fts.rowid
+JOIN segments AS s ON s.id = e.segment_id
+JOIN collections AS c ON c.id = s.collection
+WHERE embedding_fulltext_search MATCH ? AND c.name = ?
+ORDER BY score
+LIMIT ?
+"""
+
+# Trigram FTS can only match terms of three or more characters
+_TERM_RE = re.compile(r"[\w.\-:/]{3,}", re.UNICODE)
+
+
+def fts_query(text):
+    """Turn free text into an FTS5 MATCH expression: quoted terms OR-ed together."""
+    terms = dict.fromkeys(term.lower() for term in _TERM_RE.findall(text))
+    return " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def reciprocal_rank_fusion(ranked_lists, weights=None, k=60):
+    """Fuse ranked id lists: score(d) = sum_i weight_i / (k + rank_i(d)).
+
+    Returns (id, score) pairs, best first.
+    """
+    weights = weights or [1.0] * len(ranked_lists)
+    scores = {}
+    for ranked, weight in zip(ranked_lists, weights):
+        for rank, doc_id in enumerate(ranked, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + weight / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class LexicalSearcher:
+    """BM25 over the FTS5 tables in chroma.sqlite3 (read-only, one connection per thread)."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+            self._local.conn = conn
+        return conn
+
+    def search(self, query, collection_name, n_results=20):
+        """Return (embedding_id, document, bm25) rows for the best lexical matches."""
+        match = fts_query(query)
+        if not match or not os.path.exists(self.db_path):
+            return []
+        try:
+            return self._connection().execute(BM25_SQL, (match, collection_name, n_results)).fetchall()
+        except sqlite3.Error as e:
+            print("[DEBUG] Lexical search failed:", e)
+            return []
@@ -0,0 +1,59 @@
+class MessageLog:
+    """A conversation as an append-only log: a turn adds two records instead of copying the history.
+
+    `messages` is the list handed to gr.Chatbot; it is only ever appended
+    to in place. Records are written to the session store as they are
+    appended (seed messages such as the welcome greeting go out with the
+    first real turn), so a session is never saved by rewriting its whole
+    history. The log holds no store or connection itself, only plain data,
+    so it can live in a gr.State; the store is passed to each write.
+
+    A log opened from the store may hold only the latest page of a long
+    session: `offset` counts the stored messages before `messages[0]`,
+    and prepend() adds earlier pages as they are fetched. `user_turns`
+    always counts the whole conversation.
+    """
+
+    def __init__(self, messages=None, session_id=None, offset=0, user_turns=None):
+        self.messages = messages if messages is not None else []
+        self.session_id = session_id
+        self.offset = offset
+        if user_turns is None:
+            user_turns = sum(1 for m in self.messages if m.get("role") == "user")
+        self.user_turns = user_turns
+        # Loaded sessions are already stored (the loaded page and everything before it)
+        self._persisted = len(self.messages) if session_id else 0
+
+    def __len__(self):
+        return len(self.messages)
+
+    def __iter__(self):
+        return iter(self.messages)
+
+    def __getitem__(self, index):
+        return self.messages[index]
+
+    @property
+    def end(self):
+        """Position after the last message, counting messages not loaded yet."""
+        return self.offset + len(self.messages)
+
+    def prepend(self, messages):
+        """Put an earlier, already stored page in front of the loaded messages."""
+        self.messages[:0] = messages
+        self.offset = max(self.offset - len(messages), 0)
+        self._persisted += len(messages)
+
+    def append(self, store, new_session_id, *messages):
+        """Append messages and write the unsaved tail to `store`; O(len(messages)).
+
+        `new_session_id` is called for the session id on the log's first write.
+        """
+        for message in messages:
+            self.messages.append(message)
+            if message.get("role") == "user":
+                self.user_turns += 1
+        if self.session_id is None:
+            self.session_id = new_session_id()
+        store.append_messages(self.session_id, self.messages[self._persisted:])
+        self._persisted = len(self.messages)
@@ -0,0 +1,70 @@
+import threading
+
+from .embedding_config import EMBEDDING_MODEL
+
+# Encoder backends for CPU-only hosts:
+#   "torch" - PyTorch fp32 (reference)
+#   "onnx"  - ONNX Runtime graph exported by sentence-transformers
+#   "int8"  - PyTorch with Linear layers dynamically quantized to int8
+BACKENDS = ("torch", "onnx", "int8")
+DEFAULT_BACKEND = "torch"
+
+# Process-wide SentenceTransformer instances, keyed by (model name, backend).
+# sentence_transformers is imported on first use so that building the UI
+# does not pay for torch + model weights before the first page renders.
+_models = {}
+_lock = threading.Lock()
+_warmup_threads = {}
+
+
+def load_model(model_name=EMBEDDING_MODEL, backend=DEFAULT_BACKEND):
+    """Build a fresh model for `backend` (not shared; see get_model)."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown encoder backend {backend!r}, expected one of {BACKENDS}")
+    from sentence_transformers import SentenceTransformer
+
+    print("[DEBUG] Loading SentenceTransformer:", model_name, "backend=", backend)
+    if backend == "onnx":
+        return SentenceTransformer(model_name, device="cpu", backend="onnx")
+
+    model = SentenceTransformer(model_name, device="cpu")
+    if backend == "int8":
+        import torch
+
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def get_model(model_name=EMBEDDING_MODEL, backend=DEFAULT_BACKEND):
+    """Return the shared model for `model_name`/`backend`, loading it on first use."""
+    key = (model_name, backend)
+    model = _models.get(key)
+    if model is None:
+        with _lock:
+            model = _models.get(key)
+            if model is None:
+                model = load_model(model_name, backend)
+                _models[key] = model
+    return model
+
+
+def is_loaded(model_name=EMBEDDING_MODEL, backend=DEFAULT_BACKEND):
+    return (model_name, backend) in _models
+
+
+def encode(sentences, model_name=EMBEDDING_MODEL, backend=DEFAULT_BACKEND, **kwargs):
+    """SentenceTransformer.encode on the shared model."""
+    return get_model(model_name, backend).encode(sentences, **kwargs)
+
+
+def warm_up(model_name=EMBEDDING_MODEL, backend=DEFAULT_BACKEND):
+    """Load the model in a background daemon thread (no-op if already loading)."""
+    key = (model_name, backend)
+    with _lock:
+        if key in _models or key in _warmup_threads:
+            return
+        thread = threading.Thread(
+            target=get_model, args=key, name=f"warm-up-{model_name}-{backend}", daemon=True
+        )
+        _warmup_threads[key] = thread
+    thread.start()
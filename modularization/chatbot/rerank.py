@@ -0,0 +1,103 @@
+import time
+import threading
+
+RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+
+class Reranker:
+    """CPU cross-encoder that re-scores retrieved candidates within a time budget.
+
+    Candidates are scored in batches in retrieval order. Before each batch the
+    reranker checks whether another batch fits in what is left of the budget
+    (using the running mean batch time); if not it stops, and unscored
+    candidates keep their retrieval order behind the scored ones.
+    """
+
+    def __init__(self, model_name=RERANK_MODEL, batch_size=8, budget_ms=50.0):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.budget_ms = budget_ms
+        self._model = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batch_ms = None
+        self.requests = 0
+        self.truncated = 0
+        self.total_ms = 0.0
+        self.total_overlap = 0.0
+        self.total_score_gain = 0.0
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+
+                    print("[DEBUG] Loading CrossEncoder:", self.model_name)
+                    self._model = CrossEncoder(self.model_name, device="cpu")
+        return self._model
+
+    def warm_up(self):
+        """Load the cross-encoder in a background daemon thread, so no request pays for it."""
+        if self._model is None:
+            threading.Thread(target=lambda: self.model, name="warm-up-reranker", daemon=True).start()
+
+    def rerank(self, query, passages, k, budget_ms=None):
+        """Return (order, complete): indices into `passages` best first, and whether every candidate was scored."""
+        budget_ms = self.budget_ms if budget_ms is None else budget_ms
+        model = self.model  # a cold load is not charged to the budget or the batch-time average
+        start = time.perf_counter()
+        scorable = [i for i, passage in enumerate(passages) if passage]
+        scores = {}
+
+        for offset in range(0, len(scorable), self.batch_size):
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if scores and self._batch_ms is not None and elapsed_ms + self._batch_ms > budget_ms:
+                break
+            batch = scorable[offset:offset + self.batch_size]
+            batch_start = time.perf_counter()
+            batch_scores = model.predict([(query, passages[i]) for i in batch], batch_size=self.batch_size)
+            batch_ms = (time.perf_counter() - batch_start) * 1000
+            self._batch_ms = batch_ms if self._batch_ms is None else 0.8 * self._batch_ms + 0.2 * batch_ms
+            scores.update(zip(batch, map(float, batch_scores)))
+
+        scored = sorted(scores, key=scores.get, reverse=True)
+        order = scored + [i for i in range(len(passages)) if i not in scores]
+        complete = len(scores) == len(scorable)
+        self._log(order, scores, k, (time.perf_counter() - start) * 1000, complete)
+        return order, complete
+
+    def _log(self, order, scores, k, elapsed_ms, complete):
+        """Compare the reranked top-k against the retrieval top-k and keep running totals."""
+        baseline = list(range(min(k, len(order))))
+        reranked = order[:k]
+        overlap = len(set(baseline) & set(reranked)) / len(baseline) if baseline else 1.0
+
+        def mean_score(indices):
+            values = [scores[i] for i in indices if i in scores]
+            return sum(values) / len(values) if values else 0.0
+
+        gain = mean_score(reranked) - mean_score(baseline)
+        with self._stats_lock:
+            self.requests += 1
+            self.truncated += not complete
+            self.total_ms += elapsed_ms
+            self.total_overlap += overlap
+            self.total_score_gain += gain
+        print(
+            f"[DEBUG] Rerank: {len(scores)}/{len(order)} scored in {elapsed_ms:.1f} ms"
+            f"{'' if complete else ' (budget hit)'} · top-{k} overlap with retrieval {overlap:.2f}"
+            f" · mean CE score {mean_score(baseline):.3f} -> {mean_score(reranked):.3f}"
+        )
+
+    def stats(self):
+        with self._stats_lock:
+            n = self.requests or 1
+            return {
+                "requests": self.requests,
+                "truncated": self.truncated,
+                "mean_ms": self.total_ms / n,
+                "mean_topk_overlap": self.total_overlap / n,
+                "mean_score_gain": self.total_score_gain / n,
+            }
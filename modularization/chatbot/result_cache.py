@@ -0,0 +1,108 @@
+import json
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# A collection's version stamp: the highest seq_id its segments have applied
+# (max_seq_id) and the highest seq_id written to its topic in the embeddings
+# queue. Any add/update/delete through chroma bumps one of them.
+VERSION_SQL = """
+SELECT
+  (SELECT MAX(m.seq_id) FROM max_seq_id AS m JOIN segments AS s ON s.id = m.segment_id
+   WHERE s.collection = c.id),
+  (SELECT MAX(q.seq_id) FROM embeddings_queue AS q WHERE q.topic LIKE '%' || c.id)
+FROM collections AS c
+WHERE c.name = ?
+"""
+
+
+def _seq_id(value):
+    # Older chroma schemas store seq_id as an 8-byte big-endian blob
+    if isinstance(value, (bytes, bytearray)):
+        return int.from_bytes(value, "big")
+    return int(value or 0)
+
+
+class CollectionVersions:
+    """Reads collection version stamps from chroma.sqlite3 (read-only, one connection per thread)."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+
+    def get(self, name):
+        """Return a (max_seq_id, queue_seq_id) stamp, or None if it can't be read."""
+        conn = getattr(self._local, "conn", None)
+        try:
+            if conn is None:
+                conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+                self._local.conn = conn
+            row = conn.execute(VERSION_SQL, (name,)).fetchone()
+        except sqlite3.Error as e:
+            print("[DEBUG] Could not read collection version:", e)
+            return None
+        if row is None:
+            return None
+        return _seq_id(row[0]), _seq_id(row[1])
+
+
+def result_key(context, embedding, query, k, where=None):
+    """Cache key: (context, hash of the query embedding - or text if none - , k, filter)."""
+    if embedding is not None:
+        digest = hashlib.sha1(np.asarray(embedding, dtype=np.float32).tobytes()).hexdigest()
+    else:
+        digest = hashlib.sha1(" ".join(query.lower().split()).encode("utf-8")).hexdigest()
+    return context, digest, k, json.dumps(where, sort_keys=True) if where else None
+
+
+class ResultCache:
+    """LRU of ranked retrieval results, each tagged with the collection version it was computed at.
+
+    A lookup whose stored version differs from the current one is treated as
+    a miss and evicted, so results stay correct after ingestion without any
+    manual flush.
+    """
+
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and version is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+                self.invalidations += 1
+            self.misses += 1
+            return None
+
+    def put(self, key, version, value):
+        if version is None:
+            return
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
@@ -0,0 +1,621 @@
+import os
+import json
+import math
+import time
+import atexit
+import shutil
+import sqlite3
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import chromadb
+import numpy as np
+
+from .embedding_config import EMBEDDING_DIM
+from .exact_index import ExactIndex
+from .mmr import mmr
+from .lexical import LexicalSearcher, reciprocal_rank_fusion
+from .result_cache import CollectionVersions, ResultCache, result_key
+
+# chroma_db/ lives at the repository root, next to the app variants
+CHROMA_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "chroma_db"
+)
+# Published generations search a snapshot of the store under <store>.generations/<number>-<pid>
+SNAPSHOT_SUFFIX = ".generations"
+# Collections up to this size are searched exactly in NumPy instead of through HNSW
+EXACT_SEARCH_THRESHOLD = 5000
+# (vector, lexical) weights used by reciprocal-rank fusion when a context has none configured
+DEFAULT_FUSION_WEIGHTS = (1.0, 1.0)
+
+
+def collection_name(context):
+    """Map a context selector value (e.g. 'Science') to its collection name."""
+    return (context or "general").strip().lower().replace(" ", "_")
+
+
+class LatencyTracker:
+    """Rolling window of retrieval latencies checked against a p95 budget."""
+
+    def __init__(self, p95_budget_ms=250.0, window=500):
+        self.p95_budget_ms = p95_budget_ms
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, elapsed_ms):
+        with self._lock:
+            self._samples.append(elapsed_ms)
+
+    def p95(self):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return 0.0
+        return samples[max(0, math.ceil(0.95 * len(samples)) - 1)]
+
+    def over_budget(self):
+        return self.p95() > self.p95_budget_ms
+
+
+@dataclass
+class RetrievalResult:
+    context: str
+    passages: list = field(default_factory=list)
+    ids: list = field(default_factory=list)
+    distances: list = field(default_factory=list)
+    scores: list = field(default_factory=list)
+    description: str = ""
+    generation: int = 0
+    timings: dict = field(default_factory=dict)
+    p95_ms: float = 0.0
+    p95_budget_ms: float = 0.0
+
+    def format_timing(self):
+        """One-line timing summary appended to each reply."""
+        parts = ", ".join(f"{name} {ms:.1f} ms" for name, ms in self.timings.items() if name != "total")
+        summary = f"retrieval {self.timings.get('total', 0.0):.1f} ms"
+        if parts:
+            summary += f" ({parts})"
+        summary += f" · p95 {self.p95_ms:.1f}/{self.p95_budget_ms:.0f} ms"
+        if self.p95_ms > self.p95_budget_ms:
+            summary += " ⚠️ over budget"
+        return summary
+
+
+def snapshot_store(path, dest):
+    """Copy the chroma store at `path` to `dest`, for a generation that owns its segments.
+
+    Segment directories are copied first and chroma.sqlite3 last, through
+    SQLite's backup API, so the copy is consistent even while an ingest is
+    writing; chroma catches the segments up from the database's log when
+    the snapshot is opened. Other files (e.g. the ingest checkpoint) are skipped.
+    """
+    os.makedirs(dest)
+    for entry in os.scandir(path):
+        if entry.is_dir():
+            shutil.copytree(entry.path, os.path.join(dest, entry.name))
+    source = sqlite3.connect(f"file:{os.path.join(path, 'chroma.sqlite3')}?mode=ro", uri=True)
+    target = sqlite3.connect(os.path.join(dest, "chroma.sqlite3"))
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+def _system_cache():
+    """chromadb's per-path System cache, or None if this chromadb version does not have it.
+
+    PersistentClient keeps one System per path for the whole process and
+    the only public way to drop one, SharedSystemClient.clear_system_cache(),
+    stops every System, including the live generation's. So this reaches into
+    the private `_identifier_to_system` dict, as laid out in chromadb
+    0.4.x-0.6.x (chromadb.api.client before 0.5, shared_system_client since).
+    Check it again when upgrading chromadb.
+    """
+    try:
+        from chromadb.api.shared_system_client import SharedSystemClient
+    except ImportError:  # chromadb < 0.5
+        try:
+            from chromadb.api.client import SharedSystemClient
+        except ImportError:
+            return None
+    cache = getattr(SharedSystemClient, "_identifier_to_system", None)
+    return cache if isinstance(cache, dict) else None
+
+
+def _release_system(path):
+    """Stop the chromadb System behind `path`, so its snapshot can be deleted."""
+    cache = _system_cache()
+    if cache is None:
+        print("[WARN] chromadb has no per-path System cache here; snapshot files stay open until exit")
+        return
+    system = cache.pop(path, None)
+    if system is not None:
+        system.stop()
+
+
+def remove_stale_snapshots(path):
+    """Delete snapshots under <path>.generations/ left by processes that are no longer running.
+
+    Snapshot directories are named <number>-<pid>. Leftovers of this very
+    pid (an earlier process that had the same pid) count as stale too.
+    """
+    root = os.path.normpath(path) + SNAPSHOT_SUFFIX
+    try:
+        entries = list(os.scandir(root))
+    except FileNotFoundError:
+        return 0
+    removed = 0
+    for entry in entries:
+        pid = entry.name.rpartition("-")[2]
+        if not pid.isdigit() or (_alive(int(pid)) and int(pid) != os.getpid()):
+            continue
+        shutil.rmtree(entry.path, ignore_errors=True)
+        removed += 1
+    if removed:
+        print(f"[DEBUG] Removed {removed} stale index snapshots from {root}")
+    return removed
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # exists, owned by someone else
+        return True
+    return True
+
+
+class IndexGeneration:
+    """Everything a query runs against: one chroma store plus its per-context state.
+
+    A generation is built in full (collections opened, exact matrices loaded,
+    HNSW segments touched) before it is published. Requests hold a reference
+    while they run; a retired generation is released once the last of them
+    finishes, so a swap never drops or mixes in-flight requests.
+
+    `path` is the store it searches; for a published generation that is a
+    snapshot of `source` which it owns, and which close() stops and deletes.
+    """
+
+    def __init__(self, number, path=CHROMA_PATH, contexts=None, hybrid=True,
+                 exact_threshold=EXACT_SEARCH_THRESHOLD, result_cache_size=2048, source=None):
+        self.number = number
+        self.path = path
+        self.source = source or path
+        # context -> description shown with replies
+        self.contexts = dict(contexts or {})
+        self.exact_threshold = exact_threshold
+        self.lexical = LexicalSearcher(os.path.join(path, "chroma.sqlite3")) if hybrid else None
+        # Ranked results per (context, query embedding, k, filter), invalidated by the collection's seq ids
+        self.versions = CollectionVersions(os.path.join(path, "chroma.sqlite3"))
+        self.result_cache = ResultCache(result_cache_size)
+        self._exact_indexes = {}
+        self._collections = {}
+        self._client = None
+        self._lock = threading.Lock()
+        self.active = 0
+        self.retired = False
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = chromadb.PersistentClient(path=self.path)
+        return self._client
+
+    def get_collection(self, context):
+        """Return the collection (index partition) backing a context, or None if it was never ingested."""
+        name = collection_name(context)
+        collection = self._collections.get(name)
+        if collection is None:
+            try:
+                collection = self.client.get_collection(name)
+            except Exception:
+                return None
+            self._collections[name] = collection
+        return collection
+
+    def warm(self, context):
+        start = time.perf_counter()
+        collection = self.get_collection(context)
+        if collection is None:
+            return
+        count = collection.count()
+        if count and self.exact_index(collection, count, self.versions.get(collection.name)) is None:
+            # The first query loads the persisted HNSW segment into memory
+            probe = [1.0] + [0.0] * (EMBEDDING_DIM - 1)
+            collection.query(query_embeddings=[probe], n_results=1, include=[])
+        print(f"[DEBUG] Prefetched '{context}' partition ({count} vectors) in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    def exact_index(self, collection, count, version=None):
+        """In-memory matrix for small collections; None once the collection outgrows it.
+
+        Rebuilt whenever the collection's version stamp (or, without one, its size) changes.
+        """
+        if count > self.exact_threshold:
+            self._exact_indexes.pop(collection.name, None)
+            return None
+        stamp = version if version is not None else count
+        built = self._exact_indexes.get(collection.name)
+        if built is None or built[0] != stamp:
+            records = collection.get(include=["embeddings", "documents"])
+            space = (collection.metadata or {}).get("hnsw:space", "l2")
+            built = (stamp, ExactIndex(records["ids"], records["documents"], records["embeddings"], space))
+            self._exact_indexes[collection.name] = built
+        return built[1]
+
+    def candidate_vectors(self, collection, ids):
+        built = self._exact_indexes.get(collection.name)
+        if built is not None:
+            return built[1].vectors(ids)
+        records = collection.get(ids=ids, include=["embeddings"])
+        by_id = dict(zip(records["ids"], records["embeddings"]))
+        return [by_id.get(doc_id) for doc_id in ids]
+
+    @property
+    def owns_snapshot(self):
+        return self.path != self.source
+
+    def close(self):
+        """Drop in-memory matrices and caches; a snapshot generation also stops its chroma System and deletes it."""
+        print(f"[DEBUG] Releasing index generation {self.number}")
+        self._exact_indexes.clear()
+        self._collections.clear()
+        self.result_cache = ResultCache(0)
+        self._client = None
+        if self.owns_snapshot:
+            try:
+                _release_system(self.path)
+            except Exception as e:
+                print(f"[WARN] Could not stop chroma for {self.path}: {e}")
+            shutil.rmtree(self.path, ignore_errors=True)
+
+
+class Retriever:
+    """Hybrid top-k retrieval against the persisted chroma_db store.
+
+    Every context is its own index partition (one collection per context),
+    so a query only ever searches that context's vectors. prefetch() warms a
+    partition ahead of the first question, e.g. when the selector changes.
+
+    Each query runs vector search and BM25 over chroma's FTS5 tables in
+    parallel. Collections with at most `exact_threshold` vectors are kept in
+    memory as an ExactIndex and searched with one matmul; larger ones go
+    through the HNSW segment. The two rankings are merged with
+    reciprocal-rank fusion using per-context (vector, lexical) weights.
+    `encode` follows the SentenceTransformer.encode signature and must return
+    EMBEDDING_DIM-sized vectors for the model the collections were built with.
+    With `mmr_lambda` set, near-duplicate candidates are dropped by maximal
+    marginal relevance (down to k, or 2k when a reranker follows); with a
+    reranker, the remaining candidates are re-scored before the top k are
+    kept.
+
+    The store and context descriptions live in an IndexGeneration; publish()
+    builds a new one from a fresh snapshot of the store in the background
+    and swaps it in atomically. chroma keeps HNSW segments in memory as first
+    loaded, so collections re-ingested by another process (chatbot.ingest)
+    are only searched as they are now after a publish(). Snapshots left by
+    processes that have exited are deleted on startup, the live one by close().
+    """
+
+    def __init__(self, encode, path=CHROMA_PATH, top_k=3, p95_budget_ms=250.0,
+                 hybrid=True, fusion_weights=None, candidates=20, rrf_k=60,
+                 exact_threshold=EXACT_SEARCH_THRESHOLD, result_cache_size=2048, reranker=None,
+                 mmr_lambda=None, contexts=None):
+        self.encode = encode
+        self.top_k = top_k
+        self.latency = LatencyTracker(p95_budget_ms)
+        self.hybrid = hybrid
+        self.fusion_weights = fusion_weights or {}
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        self.exact_threshold = exact_threshold
+        self.result_cache_size = result_cache_size
+        # Optional cross-encoder pass over the fused candidates (see rerank.Reranker)
+        self.reranker = reranker
+        # MMR diversification of the candidates (None disables, 1.0 = relevance only)
+        self.mmr_lambda = mmr_lambda
+        # Searches that retrieve() blocks on
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="retrieval")
+        # Publishes (snapshot copies) and prefetches, one at a time and never ahead of live searches
+        self._background = ThreadPoolExecutor(max_workers=1, thread_name_prefix="retrieval-publish")
+        self._lock = threading.Lock()
+        self._generation = self._new_generation(1, path, contexts)
+        self._last_number = 1
+        self._closed = False
+        remove_stale_snapshots(path)
+        atexit.register(self.close)
+
+    def _new_generation(self, number, path, contexts, source=None):
+        return IndexGeneration(
+            number, path, contexts, self.hybrid, self.exact_threshold, self.result_cache_size, source
+        )
+
+    # === Generations ===
+    @property
+    def generation(self):
+        return self._generation
+
+    @property
+    def path(self):
+        """The live store the current generation was built from."""
+        return self._generation.source
+
+    @property
+    def contexts(self):
+        return self._generation.contexts
+
+    @property
+    def result_cache(self):
+        return self._generation.result_cache
+
+    def get_collection(self, context):
+        return self._generation.get_collection(context)
+
+    def _acquire(self):
+        with self._lock:
+            generation = self._generation
+            generation.active += 1
+            return generation
+
+    def _release(self, generation):
+        with self._lock:
+            generation.active -= 1
+            drained = generation.retired and generation.active == 0
+        if drained:
+            generation.close()
+
+    def publish(self, path=None, contexts=None):
+        """Build the next generation in the background and swap it in when ready; returns the Future.
+
+        `path` defaults to the current live store (e.g. after re-ingesting
+        its collections), `contexts` to the current descriptions. The new
+        generation opens a snapshot of `path` under <path>.generations/, so
+        it loads every segment afresh instead of reusing the System chroma
+        already holds for that path. Requests already running finish on the
+        old generation, which is released once they have drained. Publishes
+        run one at a time on their own thread.
+        """
+        return self._background.submit(self._build_and_swap, path, contexts)
+
+    def _build_and_swap(self, path, contexts):
+        current = self._generation
+        path = path or current.source
+        contexts = current.contexts if contexts is None else contexts
+        start = time.perf_counter()
+        with self._lock:
+            self._last_number += 1
+            number = self._last_number
+        # pid: another app process may publish generations of the same store
+        snapshot = os.path.join(os.path.normpath(path) + SNAPSHOT_SUFFIX, f"{number}-{os.getpid()}")
+        if os.path.exists(snapshot):  # left over from an earlier run
+            shutil.rmtree(snapshot)
+        snapshot_store(path, snapshot)
+        generation = self._new_generation(number, snapshot, contexts, source=path)
+        for context in contexts:
+            generation.warm(context)
+        with self._lock:
+            old, self._generation = self._generation, generation
+            old.retired = True
+            drained = old.active == 0
+        print(f"[DEBUG] Published index generation {generation.number} ({path}) in {time.perf_counter() - start:.1f}s")
+        if drained:
+            old.close()
+        return generation
+
+    def close(self):
+        """Stop background work and delete the live generation's snapshot (also run at exit)."""
+        if self._closed:
+            return
+        self._closed = True
+        self._background.shutdown(wait=True, cancel_futures=True)
+        self._executor.shutdown(wait=False)
+        with self._lock:
+            generation = self._generation
+        if generation.owns_snapshot:
+            generation.close()
+
+    # === Querying ===
+    def prefetch(self, context):
+        """Warm a context's partition in the background; returns the Future."""
+        return self._background.submit(self._prefetch, context)
+
+    def _prefetch(self, context):
+        generation = self._acquire()
+        try:
+            generation.warm(context)
+        finally:
+            self._release(generation)
+
+    def _embed(self, query, timings):
+        start = time.perf_counter()
+        embedding = self.encode([query], normalize_embeddings=True)[0]
+        timings["embed"] = (time.perf_counter() - start) * 1000
+        return embedding
+
+    def _vector_search(self, generation, collection, count, version, embedding, n_results, where, timings):
+        start = time.perf_counter()
+        exact = generation.exact_index(collection, count, version) if where is None else None
+        if exact is not None:
+            hits = exact.search(embedding, n_results)
+            timings["exact"] = (time.perf_counter() - start) * 1000
+            return hits
+
+        response = collection.query(
+            query_embeddings=[list(map(float, embedding))],
+            n_results=n_results,
+            where=where,
+            include=["documents", "distances"],
+        )
+        timings["ann"] = (time.perf_counter() - start) * 1000
+        return list(zip(response["ids"][0], response["documents"][0], response["distances"][0]))
+
+    def _lexical_search(self, lexical, query, name, n_results):
+        start = time.perf_counter()
+        hits = lexical.search(query, name, n_results)
+        return hits, (time.perf_counter() - start) * 1000
+
+    def retrieve(self, query, context, k=None, where=None):
+        """Return the k best passages of the context's collection for `query`.
+
+        `where` is a chroma metadata filter; filtered queries skip BM25 and
+        the exact index and go straight to the collection.
+        """
+        k = k or self.top_k
+        start = time.perf_counter()
+        result = RetrievalResult(context=context, p95_budget_ms=self.latency.p95_budget_ms)
+
+        generation = self._acquire()
+        try:
+            result.generation = generation.number
+            result.description = generation.contexts.get(context, "")
+            collection = generation.get_collection(context)
+            count = collection.count() if collection is not None else 0
+            if count:
+                n_candidates = min(max(k, self.candidates), count)
+                vector_weight, lexical_weight = self.fusion_weights.get(context, DEFAULT_FUSION_WEIGHTS)
+                embedding = self._embed(query, result.timings) if vector_weight > 0 else None
+
+                # Version is read before searching, so a concurrent write can only invalidate, never go stale
+                version = generation.versions.get(collection.name)
+                key = result_key(context, embedding, query, k, where)
+                cached = generation.result_cache.get(key, version)
+                if cached is not None:
+                    result.ids, result.passages, result.distances, result.scores = (list(part) for part in cached)
+                    result.timings["cache"] = (time.perf_counter() - start) * 1000 - result.timings.get("embed", 0.0)
+                else:
+                    complete = self._search(result, generation, collection, count, version, query, embedding, k,
+                                            n_candidates, (vector_weight, lexical_weight), where)
+                    # A rerank cut short by its budget is not worth replaying from the cache
+                    if complete:
+                        generation.result_cache.put(
+                            key, version, (result.ids, result.passages, result.distances, result.scores)
+                        )
+        finally:
+            self._release(generation)
+
+        result.timings["total"] = (time.perf_counter() - start) * 1000
+        self.latency.record(result.timings["total"])
+        result.p95_ms = self.latency.p95()
+        if result.p95_ms > result.p95_budget_ms:
+            print(f"[WARN] Retrieval p95 {result.p95_ms:.1f} ms exceeds budget {result.p95_budget_ms:.0f} ms")
+        return result
+
+    def _search(self, result, generation, collection, count, version, query, embedding, k, n_candidates,
+                weights, where):
+        """Run vector search and BM25 in parallel, fuse (and rerank) them into `result`.
+
+        Returns False when the reranker ran out of budget before scoring every candidate.
+        """
+        vector_weight, lexical_weight = weights
+        lexical_job = None
+        if generation.lexical is not None and lexical_weight > 0 and where is None:
+            lexical_job = self._executor.submit(
+                self._lexical_search, generation.lexical, query, collection.name, n_candidates
+            )
+        vector_hits = []
+        if embedding is not None:
+            vector_hits = self._vector_search(
+                generation, collection, count, version, embedding, n_candidates, where, result.timings
+            )
+        lexical_hits = []
+        if lexical_job is not None:
+            lexical_hits, result.timings["lexical"] = lexical_job.result()
+
+        fused_start = time.perf_counter()
+        documents = {doc_id: doc for doc_id, doc, _ in lexical_hits}
+        documents.update((doc_id, doc) for doc_id, doc, _ in vector_hits if doc is not None)
+        distances = {doc_id: distance for doc_id, _, distance in vector_hits}
+        fused = reciprocal_rank_fusion(
+            [[hit[0] for hit in vector_hits], [hit[0] for hit in lexical_hits]],
+            [vector_weight, lexical_weight],
+            self.rrf_k,
+        )
+        if lexical_hits:
+            result.timings["fusion"] = (time.perf_counter() - fused_start) * 1000
+
+        pool = 2 * k if self.reranker is not None else k
+        if self.mmr_lambda is not None and embedding is not None and len(fused) > pool:
+            mmr_start = time.perf_counter()
+            vectors = generation.candidate_vectors(collection, [doc_id for doc_id, _ in fused])
+            usable = [i for i, vector in enumerate(vectors) if vector is not None]
+            if usable:
+                picked = mmr(embedding, np.stack([vectors[i] for i in usable]), pool, self.mmr_lambda)
+                fused = [fused[usable[i]] for i in picked]
+            result.timings["mmr"] = (time.perf_counter() - mmr_start) * 1000
+
+        complete = True
+        if self.reranker is not None and len(fused) > 1:
+            rerank_start = time.perf_counter()
+            order, complete = self.reranker.rerank(query, [documents.get(doc_id) for doc_id, _ in fused], k)
+            fused = [fused[i] for i in order]
+            result.timings["rerank"] = (time.perf_counter() - rerank_start) * 1000
+
+        fused = fused[:k]
+        result.ids = [doc_id for doc_id, _ in fused]
+        result.scores = [score for _, score in fused]
+        # Vectors stored without a document come back as None passages (filtered downstream)
+        result.passages = [documents.get(doc_id) for doc_id in result.ids]
+        result.distances = [distances.get(doc_id) for doc_id in result.ids]
+        return complete
+
+
+class ManifestWatcher:
+    """Publish a new index generation whenever a knowledge-base manifest file changes.
+
+    The manifest is JSON: {"chroma_path": "...", "contexts": {"Science": "description", ...}}.
+    Both keys are optional; a missing chroma_path keeps the current store.
+    """
+
+    def __init__(self, retriever, path, interval=10.0):
+        self.retriever = retriever
+        self.path = path
+        self.interval = interval
+        self._mtime = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def load(self):
+        with open(self.path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        chroma_path = manifest.get("chroma_path")
+        if chroma_path and not os.path.isabs(chroma_path):
+            chroma_path = os.path.join(os.path.dirname(os.path.abspath(self.path)), chroma_path)
+        return chroma_path, manifest.get("contexts")
+
+    def check(self):
+        """Publish if the manifest changed since the last check; returns the publish Future or None."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        if mtime == self._mtime:
+            return None
+        self._mtime = mtime
+        try:
+            chroma_path, contexts = self.load()
+        except (OSError, ValueError) as e:
+            print(f"[WARN] Ignoring unreadable manifest {self.path}: {e}")
+            return None
+        print(f"[DEBUG] Manifest {self.path} changed, publishing a new index generation")
+        return self.retriever.publish(chroma_path, contexts)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="manifest-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.check()
+            self._stop.wait(self.interval)
@@ -0,0 +1,90 @@
+"""Measure how session-store throughput scales with concurrent users.
+
+Each worker thread plays one user appending turns (two messages each) to
+its own session and reopening it, for 1, 2, 4... threads. It runs against
+one shared SessionManager partition and against a ShardedSessionStore
+whose users land on different shards. Measured here, neither scales:
+speedups stay around 1.0x with 2 and 4 threads in both setups, since each
+append is short and mostly Python (GIL-bound) work around SQLite. Sharding
+is kept for isolation between owners, not for throughput; the
+correctness checks live in tests/test_session_store.py.
+
+    python -m chatbot.session_benchmark --turns 2000 --shards 8
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from .session_manager import ShardedSessionStore
+
+
+def owners_on_distinct_shards(store, count):
+    """`count` owner keys that map to different shards (as far as there are shards)."""
+    owners, used = [], set()
+    candidate = 0
+    while len(owners) < count:
+        owner = f"user-{candidate}"
+        candidate += 1
+        shard = id(store.shard(owner))
+        if shard not in used or len(used) == len(store.shards):
+            owners.append(owner)
+            used.add(shard)
+    return owners
+
+
+def run(store, threads, turns):
+    owners = owners_on_distinct_shards(store, threads)
+    barrier = threading.Barrier(threads + 1)
+
+    def user(owner):
+        sessions = store.for_owner(owner)
+        session_id = sessions.create_session(f"{owner} chat")
+        barrier.wait()
+        for turn in range(turns):
+            sessions.append_messages(session_id, [
+                {"role": "user", "content": f"question {turn}"},
+                {"role": "assistant", "content": f"answer {turn}"},
+            ])
+            if turn % 100 == 99:
+                sessions.get_session(session_id)
+
+    workers = [threading.Thread(target=user, args=(owner,)) for owner in owners]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    store.flush()
+    return threads * turns / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=2000, help="turns per user")
+    parser.add_argument("--shards", type=int, default=8)
+    parser.add_argument("--max-threads", type=int, default=os.cpu_count() or 4)
+    args = parser.parse_args()
+
+    counts = []
+    threads = 1
+    while threads <= args.max_threads:
+        counts.append(threads)
+        threads *= 2
+
+    print(f"{'threads':>7} {'1 partition':>14} {'speedup':>8} {f'{args.shards} shards':>14} {'speedup':>8}")
+    base = {}
+    for threads in counts:
+        row = []
+        for shards in (1, args.shards):
+            with tempfile.TemporaryDirectory() as tmp:
+                rate = run(ShardedSessionStore(os.path.join(tmp, "sessions.sqlite3"), shards=shards), threads, args.turns)
+            base.setdefault(shards, rate)
+            row += [rate, rate / base[shards]]
+        print(f"{threads:>7} {row[0]:>12.0f}/s {row[1]:>7.2f}x {row[2]:>12.0f}/s {row[3]:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
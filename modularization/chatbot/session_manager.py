@@ -1,12 +1,445 @@
+import os
+import re
+import json
+import time
+import atexit
+import sqlite3
+import threading
+import zlib
+
+SESSIONS_DB = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "sessions.sqlite3"
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    owner TEXT NOT NULL DEFAULT '',
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    user_turns INTEGER NOT NULL DEFAULT 0,
+    summary TEXT NOT NULL DEFAULT '',
+    summary_upto INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS messages (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    metadata TEXT,
+    created REAL NOT NULL,
+    PRIMARY KEY (session_id, seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS sessions_created ON sessions (created);
+"""
+# Owner key for requests without a login: a random per-browser id the page script keeps in this cookie
+OWNER_COOKIE = "brainbot_owner"
+OWNER_COOKIE_PATTERN = re.compile(r"[0-9a-f-]{16,64}")
+# Everyone without a login or owner cookie (and calls made outside a request) shares this owner
+SHARED_OWNER = "local"
+
+OWNER_INDEX = "CREATE INDEX IF NOT EXISTS sessions_owner ON sessions (owner, created)"
+
+# Fixed statement texts, so sqlite3's per-connection statement cache prepares each one once
+UPSERT_SESSION = """
+INSERT INTO sessions (id, name, owner, created, updated, message_count) VALUES (?, ?, ?, ?, ?, 0)
+ON CONFLICT (id) DO UPDATE SET updated = excluded.updated
+"""
+INSERT_MESSAGE = "INSERT INTO messages (session_id, seq, role, content, metadata, created) VALUES (?, ?, ?, ?, ?, ?)"
+BUMP_COUNT = """
+UPDATE sessions SET message_count = message_count + ?, user_turns = user_turns + ?, updated = ? WHERE id = ?
+"""
+SELECT_COUNT = "SELECT message_count FROM sessions WHERE id = ?"
+SELECT_USER_TURNS = "SELECT user_turns FROM sessions WHERE id = ?"
+SELECT_MESSAGES = "SELECT role, content, metadata FROM messages WHERE session_id = ? ORDER BY seq"
+# seq runs 0..message_count-1 without gaps, so a page is a primary-key range scan
+SELECT_PAGE = """
+SELECT role, content, metadata FROM messages WHERE session_id = ? AND seq >= ? AND seq < ? ORDER BY seq
+"""
+SELECT_SESSIONS = "SELECT id FROM sessions ORDER BY created, rowid"
+SELECT_OWNED_SESSIONS = "SELECT id FROM sessions WHERE owner = ? ORDER BY created, rowid"
+SELECT_NAMES = "SELECT id, name FROM sessions ORDER BY created, rowid"
+SELECT_OWNED_NAMES = "SELECT id, name FROM sessions WHERE owner = ? ORDER BY created, rowid"
+SELECT_NAME = "SELECT name FROM sessions WHERE id = ?"
+SELECT_OWNER = "SELECT owner FROM sessions WHERE id = ?"
+CLEAR_MESSAGES = "DELETE FROM messages WHERE session_id = ?"
+RESET_COUNT = "UPDATE sessions SET message_count = 0, user_turns = 0 WHERE id = ?"
+DELETE_SESSION = "DELETE FROM sessions WHERE id = ?"
+RENAME_SESSION = "UPDATE sessions SET name = ? WHERE id = ?"
+RENAME_OWNED_SESSION = "UPDATE sessions SET name = ? WHERE id = ? AND owner = ?"
+SET_SUMMARY = "UPDATE sessions SET summary = ?, summary_upto = ? WHERE id = ?"
+SELECT_SUMMARY = "SELECT summary, summary_upto FROM sessions WHERE id = ?"
+
+
+def _message_to_row(message):
+    """(role, content, metadata) columns of a message, as stored."""
+    metadata = message.get("metadata")
+    return message.get("role", ""), str(message.get("content") or ""), json.dumps(metadata) if metadata else None
+
+
+def _row_to_message(role, content, metadata):
+    message = {"role": role, "content": content}
+    if metadata:
+        message["metadata"] = json.loads(metadata)
+    return message
+
+
+CROCKFORD32 = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+
+def new_session_id():
+    """A ULID: 48-bit millisecond timestamp + 80 random bits as 26 Crockford base32 chars.
+
+    Ids sort by creation time and never change, so a session keeps its id
+    (and its message rows) through any number of renames.
+    """
+    value = (int(time.time() * 1000) << 80) | int.from_bytes(os.urandom(10), "big")
+    chars = []
+    for _ in range(26):
+        value, digit = divmod(value, 32)
+        chars.append(CROCKFORD32[digit])
+    return "".join(reversed(chars))
+
+
 class SessionManager:
-    def __init__(self):
-        self.sessions = {}
+    """Chat sessions stored in SQLite (WAL): a `sessions` table and an append-only `messages` table.
+
+    Sessions are keyed by an immutable id (see new_session_id); the display
+    name is a plain column, so renaming is a one-row update.
+
+    Also usable as a drop-in for the old `chat_sessions` dict
+    (`sessions[name] = history`, `sessions[name]`, `in`, `del`, `pop`);
+    nothing is held in memory beyond SQLite's page cache. Writes share one
+    connection and are committed in batches - every `commit_every` writes
+    or `commit_interval` seconds, whichever comes first, and at exit - so a
+    burst of messages costs one fsync instead of one each.
+    """
+
+    def __init__(self, path=SESSIONS_DB, commit_every=64, commit_interval=0.5):
+        self.path = path
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self.conn = sqlite3.connect(path, check_same_thread=False, cached_statements=64)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(sessions)")]
+        if "owner" not in columns:  # stores created before sessions had owners
+            self.conn.execute("ALTER TABLE sessions ADD COLUMN owner TEXT NOT NULL DEFAULT ''")
+        if "user_turns" not in columns:  # stores created before paged loading; count once
+            self.conn.execute("ALTER TABLE sessions ADD COLUMN user_turns INTEGER NOT NULL DEFAULT 0")
+            self.conn.execute(
+                "UPDATE sessions SET user_turns = "
+                "(SELECT COUNT(*) FROM messages WHERE session_id = sessions.id AND role = 'user')"
+            )
+            self.conn.commit()
+        if "summary_upto" not in columns:  # stores created before summaries were persisted per update
+            self.conn.execute("ALTER TABLE sessions ADD COLUMN summary_upto INTEGER NOT NULL DEFAULT 0")
+        self.conn.execute(OWNER_INDEX)
+        self._lock = threading.RLock()
+        self._pending = 0
+        self._timer = None
+        atexit.register(self.close)
+
+    # === Writes (batched) ===
+    def _wrote(self, count=1):
+        """Count uncommitted writes; commit now or schedule a flush. Caller holds the lock."""
+        self._pending += count
+        if self._pending >= self.commit_every:
+            self._commit()
+        elif self._timer is None:
+            self._timer = threading.Timer(self.commit_interval, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _commit(self):
+        self.conn.commit()
+        self._pending = 0
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def flush(self):
+        with self._lock:
+            if self._pending:
+                self._commit()
+            self._timer = None
+
+    def close(self):
+        self.flush()
+
+    def append_messages(self, session_id, messages, name=None, owner=""):
+        """Append messages to a session (created if needed); earlier messages are never rewritten."""
+        now = time.time()
+        with self._lock:
+            self.conn.execute(UPSERT_SESSION, (session_id, name or session_id, owner or "", now, now))
+            start = self.conn.execute(SELECT_COUNT, (session_id,)).fetchone()[0]
+            rows = [(session_id, start + i, *_message_to_row(m), now) for i, m in enumerate(messages)]
+            self.conn.executemany(INSERT_MESSAGE, rows)
+            user_turns = sum(1 for row in rows if row[2] == "user")
+            self.conn.execute(BUMP_COUNT, (len(rows), user_turns, now, session_id))
+            self._wrote(len(rows) + 1)
+
+    def create_session(self, name, owner=""):
+        """Register a new, empty session named `name` and return its id."""
+        session_id = new_session_id()
+        now = time.time()
+        with self._lock:
+            self.conn.execute(UPSERT_SESSION, (session_id, name, owner or "", now, now))
+            self._wrote()
+        return session_id
 
     def add_session(self, session_name, session_data):
-        self.sessions[session_name] = session_data
+        """Store a whole history under `session_name`, replacing any previous one.
+
+        A history that extends the stored one (the usual `sessions[name] =
+        history` after a turn) only appends its new tail; anything else is
+        rewritten. The check compares the last stored message, so it costs
+        one row read rather than reading the whole session back.
+        """
+        session_data = list(session_data)
+        with self._lock:
+            row = self.conn.execute(SELECT_COUNT, (session_name,)).fetchone()
+            count = row[0] if row else 0
+            if row is not None and count <= len(session_data):
+                last = count and self.conn.execute(SELECT_PAGE, (session_name, count - 1, count)).fetchone()
+                if not count or tuple(last) == _message_to_row(session_data[count - 1]):
+                    if count < len(session_data):
+                        self.append_messages(session_name, session_data[count:], name=session_name)
+                    return
+            self.conn.execute(CLEAR_MESSAGES, (session_name,))
+            self.conn.execute(RESET_COUNT, (session_name,))
+            self.append_messages(session_name, session_data, name=session_name)
+
+    def rename_session(self, session_id, new_name, owner=None):
+        """Change a session's display name; its id and messages are untouched."""
+        with self._lock:
+            if owner is None:
+                renamed = self.conn.execute(RENAME_SESSION, (new_name, session_id)).rowcount
+            else:
+                renamed = self.conn.execute(RENAME_OWNED_SESSION, (new_name, session_id, owner)).rowcount
+            if renamed:
+                self._wrote()
+        return bool(renamed)
+
+    def delete_session(self, session_name, owner=None):
+        with self._lock:
+            if not self.owns(session_name, owner):
+                return False
+            self.conn.execute(CLEAR_MESSAGES, (session_name,))
+            deleted = self.conn.execute(DELETE_SESSION, (session_name,)).rowcount
+            self._wrote()
+        return bool(deleted)
+
+    def set_summary(self, session_name, summary, upto=0):
+        """Store a session's rolling summary and how many messages it covers."""
+        with self._lock:
+            self.conn.execute(SET_SUMMARY, (summary or "", upto, session_name))
+            self._wrote()
+
+    # === Reads ===
+    def owns(self, session_name, owner=None):
+        """Whether the session exists and belongs to `owner` (None: any owner)."""
+        with self._lock:
+            row = self.conn.execute(SELECT_OWNER, (session_name,)).fetchone()
+        return row is not None and (owner is None or row[0] == owner)
+
+    def get_session(self, session_name, owner=None):
+        """The session's messages in order, or None if there is no such session (owned by `owner`)."""
+        with self._lock:
+            if not self.owns(session_name, owner):
+                return None
+            rows = self.conn.execute(SELECT_MESSAGES, (session_name,)).fetchall()
+        return [_row_to_message(*row) for row in rows]
+
+    def get_page(self, session_id, before=None, limit=50, owner=None):
+        """Up to `limit` messages just before position `before` (default: the end), oldest first.
+
+        Returns (messages, start), where `start` is the position of the first
+        message returned and the cursor for the next, earlier page (0 when
+        there is nothing earlier), or None if there is no such session.
+        Cost depends on `limit`, not on how long the session is.
+        """
+        with self._lock:
+            if not self.owns(session_id, owner):
+                return None
+            if before is None:
+                before = self.conn.execute(SELECT_COUNT, (session_id,)).fetchone()[0]
+            start = max(before - limit, 0)
+            rows = self.conn.execute(SELECT_PAGE, (session_id, start, before)).fetchall()
+        return [_row_to_message(*row) for row in rows], start
+
+    def get_user_turns(self, session_id):
+        """Number of user messages stored for a session (kept as a counter, not counted per call)."""
+        with self._lock:
+            row = self.conn.execute(SELECT_USER_TURNS, (session_id,)).fetchone()
+        return row[0] if row else 0
+
+    def get_name(self, session_id):
+        with self._lock:
+            row = self.conn.execute(SELECT_NAME, (session_id,)).fetchone()
+        return row[0] if row else None
+
+    def get_summary(self, session_name):
+        """(summary, upto) as stored by set_summary; ("", 0) if there is none."""
+        with self._lock:
+            row = self.conn.execute(SELECT_SUMMARY, (session_name,)).fetchone()
+        return (row[0], row[1]) if row else ("", 0)
+
+    def list_sessions(self, owner=None):
+        with self._lock:
+            if owner is None:
+                return [row[0] for row in self.conn.execute(SELECT_SESSIONS)]
+            return [row[0] for row in self.conn.execute(SELECT_OWNED_SESSIONS, (owner,))]
 
-    def get_session(self, session_name):
-        return self.sessions.get(session_name)
+    def session_names(self, owner=None):
+        """{session id: display name}, oldest first - what the sidebar lists."""
+        with self._lock:
+            if owner is None:
+                return dict(self.conn.execute(SELECT_NAMES).fetchall())
+            return dict(self.conn.execute(SELECT_OWNED_NAMES, (owner,)).fetchall())
+
+    # === dict-style access, for code written against chat_sessions = {} ===
+    def __contains__(self, session_name):
+        with self._lock:
+            return self.conn.execute(SELECT_COUNT, (session_name,)).fetchone() is not None
+
+    def __getitem__(self, session_name):
+        messages = self.get_session(session_name)
+        if messages is None:
+            raise KeyError(session_name)
+        return messages
+
+    def __setitem__(self, session_name, session_data):
+        self.add_session(session_name, session_data)
+
+    def __delitem__(self, session_name):
+        if not self.delete_session(session_name):
+            raise KeyError(session_name)
+
+    def get(self, session_name, default=None):
+        messages = self.get_session(session_name)
+        return default if messages is None else messages
+
+    def pop(self, session_name, *default):
+        with self._lock:
+            messages = self.get_session(session_name)
+            if messages is None:
+                if default:
+                    return default[0]
+                raise KeyError(session_name)
+            self.delete_session(session_name)
+        return messages
+
+    def __iter__(self):
+        return iter(self.list_sessions())
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+def request_owner(request):
+    """Owner key of a Gradio request: the logged-in user, else the browser's owner cookie, else SHARED_OWNER.
+
+    Never the Gradio session_hash: that changes on every page load, which
+    would orphan a browser's chats on reload or restart.
+    """
+    if request is None:
+        return SHARED_OWNER
+    username = getattr(request, "username", None)
+    if username:
+        return username
+    browser_id = (getattr(request, "cookies", None) or {}).get(OWNER_COOKIE, "")
+    if OWNER_COOKIE_PATTERN.fullmatch(browser_id):
+        return "browser:" + browser_id
+    return SHARED_OWNER
+
+
+# Page script that gives each browser a stable OWNER_COOKIE (add it to the Blocks head)
+OWNER_COOKIE_JS = """
+<script>
+(function(){
+  if (document.cookie.split("; ").some(function(c){ return c.indexOf("%(name)s=") === 0; })) return;
+  var id = (window.crypto && crypto.randomUUID) ? crypto.randomUUID()
+    : Array.from(crypto.getRandomValues(new Uint8Array(16)), function(b){ return b.toString(16).padStart(2, "0"); }).join("");
+  document.cookie = "%(name)s=" + id + "; max-age=31536000; path=/; SameSite=Lax";
+})();
+</script>
+""" % {"name": OWNER_COOKIE}
+
+
+class OwnerSessions:
+    """One owner's view of a SessionManager: the same calls, limited to sessions that owner created."""
+
+    def __init__(self, store, owner):
+        self.store = store
+        self.owner = owner
+
+    def append_messages(self, session_id, messages, name=None):
+        self.store.append_messages(session_id, messages, name, owner=self.owner)
+
+    def create_session(self, name):
+        return self.store.create_session(name, owner=self.owner)
+
+    def get_session(self, session_id):
+        return self.store.get_session(session_id, owner=self.owner)
+
+    def get_page(self, session_id, before=None, limit=50):
+        return self.store.get_page(session_id, before, limit, owner=self.owner)
+
+    def get_user_turns(self, session_id):
+        return self.store.get_user_turns(session_id) if session_id in self else 0
+
+    def get_name(self, session_id):
+        return self.store.get_name(session_id) if session_id in self else None
 
     def list_sessions(self):
-        return list(self.sessions.keys())
+        return self.store.list_sessions(owner=self.owner)
+
+    def session_names(self):
+        return self.store.session_names(owner=self.owner)
+
+    def rename_session(self, session_id, new_name):
+        return self.store.rename_session(session_id, new_name, owner=self.owner)
+
+    def delete_session(self, session_name):
+        return self.store.delete_session(session_name, owner=self.owner)
+
+    def set_summary(self, session_name, summary, upto=0):
+        if self.store.owns(session_name, self.owner):
+            self.store.set_summary(session_name, summary, upto)
+
+    def get_summary(self, session_name):
+        return self.store.get_summary(session_name) if session_name in self else ("", 0)
+
+    def __contains__(self, session_name):
+        return self.store.owns(session_name, self.owner)
+
+
+class ShardedSessionStore:
+    """Sessions partitioned by owner across N independent SessionManagers.
+
+    Each shard is its own SQLite file with its own connection and lock, and
+    an owner always maps to the same shard (crc32 of the owner key), so
+    handlers for owners on different shards don't queue behind one lock.
+    That is not a throughput win under CPython (session_benchmark measures
+    no speedup with more threads); what it buys is isolation between owners.
+    for_owner() gives the scoped view handlers should use.
+    """
+
+    def __init__(self, path=SESSIONS_DB, shards=8, **kwargs):
+        root, ext = os.path.splitext(path)
+        self.shards = [SessionManager(f"{root}-{i}{ext}", **kwargs) for i in range(shards)]
+
+    def shard(self, owner):
+        return self.shards[zlib.crc32(owner.encode("utf-8")) % len(self.shards)]
+
+    def for_owner(self, owner):
+        return OwnerSessions(self.shard(owner), owner)
+
+    def flush(self):
+        for shard in self.shards:
+            shard.flush()
@@ -0,0 +1,156 @@
+import os
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import chromadb
+
+from .embedding_cache import normalize_query
+from .exact_index import ExactIndex
+from .result_cache import CollectionVersions
+from .retrieval import CHROMA_PATH
+
+SESSIONS_COLLECTION = "chat_sessions"
+
+
+def session_text(history, max_chars=2000):
+    """Text a session is embedded from: its user turns, most recent last, capped at max_chars."""
+    turns = [str(m.get("content") or "") for m in history if isinstance(m, dict) and m.get("role") == "user"]
+    return "\n".join(turns)[-max_chars:]
+
+
+class SessionIndex:
+    """Semantic search over saved chat sessions in the `chat_sessions` collection.
+
+    Each session is one vector stored under its session id, with
+    `session_name`, `owner` and `summary` metadata; the messages themselves
+    live only in the session store (SQLite) and are loaded from there by id.
+    The collection is small, so it is searched as an in-memory
+    ExactIndex, rebuilt whenever the collection's version stamp changes.
+    Query embeddings go through `encode` (normally an EmbeddingCache, so a
+    prefix typed twice is embedded once) and ranked results are memoised
+    per normalized query until the collection changes.
+
+    Entries written before that kept the whole history as JSON metadata. With
+    a `store` (ShardedSessionStore) they are migrated on first use: the
+    history is copied into the owner's store if it is not there yet and the
+    blob is dropped. Legacy entries without an owner belong to no one and
+    are skipped (left as they are, never returned).
+    """
+
+    def __init__(self, encode, path=CHROMA_PATH, collection=SESSIONS_COLLECTION, min_score=0.2,
+                 result_cache_size=256, store=None):
+        self.encode = encode
+        self.store = store
+        self._migrated = store is None
+        self.path = path
+        self.collection_name = collection
+        self.min_score = min_score
+        self.versions = CollectionVersions(os.path.join(path, "chroma.sqlite3"))
+        self._client = None
+        self._collection = None
+        self._index = None  # (stamp, ExactIndex, {id: metadata})
+        self._results = OrderedDict()
+        self._result_cache_size = result_cache_size
+        self._lock = threading.Lock()
+        self._migrate_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-index")
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            with self._lock:
+                if self._collection is None:
+                    self._client = chromadb.PersistentClient(path=self.path)
+                    self._collection = self._client.get_or_create_collection(self.collection_name)
+        return self._collection
+
+    def _migrate(self):
+        """Move legacy `history` blobs into the session store (once per process)."""
+        records = self.collection.get(include=["embeddings", "metadatas"])
+        moved = ownerless = 0
+        for doc_id, embedding, metadata in zip(records["ids"], records["embeddings"], records["metadatas"] or []):
+            metadata = dict(metadata or {})
+            if "history" not in metadata:
+                continue
+            if not metadata.get("owner"):
+                ownerless += 1
+                continue
+            sessions = self.store.for_owner(metadata["owner"])
+            if doc_id not in sessions:
+                sessions.append_messages(doc_id, json.loads(metadata["history"] or "[]"), name=metadata.get("session_name"))
+            del metadata["history"]
+            self.collection.upsert(ids=[doc_id], embeddings=[list(map(float, embedding))], metadatas=[metadata])
+            moved += 1
+        if moved or ownerless:
+            print(f"[DEBUG] Session index: {moved} stored histories moved to the session store, "
+                  f"{ownerless} without an owner skipped")
+
+    def _current_index(self):
+        if not self._migrated:
+            with self._migrate_lock:
+                if not self._migrated:
+                    self._migrate()
+                    self._migrated = True
+        collection = self.collection
+        stamp = self.versions.get(self.collection_name) or collection.count()
+        built = self._index
+        if built is None or built[0] != stamp:
+            records = collection.get(include=["embeddings", "metadatas"])
+            index = ExactIndex(records["ids"], None, records["embeddings"], space="cosine")
+            built = (stamp, index, dict(zip(records["ids"], records["metadatas"] or [])))
+            self._index = built
+            print(f"[DEBUG] Session index rebuilt ({len(index)} sessions)")
+        return built
+
+    def search(self, query, k=10, owner=None):
+        """Return up to k (session_id, session_name, similarity) triples, best first (only `owner`'s sessions if given)."""
+        text = normalize_query(query)
+        if not text:
+            return []
+        stamp, index, metadatas = self._current_index()
+        if not len(index):
+            return []
+        key = (text, k, owner)
+        with self._lock:  # handlers search from several Gradio worker threads
+            cached = self._results.get(key)
+            if cached is not None and cached[0] == stamp:
+                self._results.move_to_end(key)
+                return cached[1]
+
+        embedding = self.encode([text], normalize_embeddings=True)[0]
+        hits = []
+        # With an owner filter, rank everything and keep that owner's top k
+        for doc_id, _, distance in index.search(embedding, k if owner is None else len(index)):
+            metadata = metadatas.get(doc_id) or {}
+            score = 1.0 - distance
+            name = metadata.get("session_name")
+            if not metadata.get("owner") or (owner is not None and metadata["owner"] != owner):
+                continue  # legacy entries without an owner belong to no one
+            if name and score >= self.min_score:
+                hits.append((doc_id, name, score))
+            if len(hits) == k:
+                break
+        with self._lock:
+            self._results[key] = (stamp, hits)
+            self._results.move_to_end(key)
+            if len(self._results) > self._result_cache_size:
+                self._results.popitem(last=False)
+        return hits
+
+    def add(self, session_id, session_name, history, summary="", owner=""):
+        """Embed a saved session's user turns and upsert it (name, owner, summary) in the background; returns the Future."""
+        return self._executor.submit(self._add, session_id, session_name, list(history), summary, owner)
+
+    def _add(self, session_id, session_name, history, summary, owner):
+        text = session_text(history)
+        if not text:
+            return
+        embedding = self.encode([text], normalize_embeddings=True)[0]
+        self.collection.upsert(
+            ids=[session_id],
+            embeddings=[list(map(float, embedding))],
+            metadatas=[{"session_name": session_name, "owner": owner or "", "summary": summary or ""}],
+        )
+
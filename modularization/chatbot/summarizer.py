@@ -0,0 +1,188 @@
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .embedding_config import EMBEDDING_DIM
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def split_sentences(message, min_chars=20):
+    """Sentences of one chat message, prefixed with its role.
+
+    Quoted passages ("> "), timing lines ("_...") and recalled-turn blocks
+    are bot scaffolding rather than conversation, so they are skipped.
+    """
+    role = "User" if message.get("role") == "user" else "Assistant"
+    sentences = []
+    for line in str(message.get("content") or "").splitlines():
+        line = line.strip()
+        if not line or line.startswith((">", "_", "↩")):
+            continue
+        sentences.extend(
+            f"{role}: {sentence}" for sentence in _SENTENCE_END.split(line) if len(sentence) >= min_chars
+        )
+    return sentences
+
+
+class _SummaryState:
+    def __init__(self, dim):
+        self.centroid_sum = np.zeros(dim, dtype=np.float32)
+        self.count = 0
+        self.upto = 0  # messages already folded into the summary
+        self.order = []  # candidate sentence positions (for chronological output)
+        self.sentences = []
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.summary = []
+        self.saved = ""  # summary text last handed to `save`
+
+
+class RollingSummarizer:
+    """Extractive, CPU-only rolling summary of the older part of each conversation.
+
+    Older messages are split into sentences and embedded once. A running
+    sum of their vectors gives the conversation centroid, and the summary is
+    the `max_sentences` sentences closest to it (skipping near-duplicates),
+    in chronological order. An update only embeds messages added since the
+    last one and runs once at least `threshold` new older messages have
+    piled up. The candidate pool is capped at `pool_size`, so memory per
+    session stays bounded however long the chat gets.
+
+    After an update that changed it, the summary can be saved next to the
+    session (the `save` callback of update); seed() picks it up again when
+    the session is reopened, so folding carries on from where it stopped.
+    """
+
+    def __init__(self, encode, threshold=10, max_sentences=5, pool_size=64, max_sessions=256, dim=EMBEDDING_DIM):
+        self.encode = encode
+        self.threshold = threshold
+        self.max_sentences = max_sentences
+        self.pool_size = pool_size
+        self.max_sessions = max_sessions
+        self.dim = dim
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summarizer")
+
+    def _state(self, session_id):
+        with self._lock:
+            state = self._states.get(session_id)
+            if state is None:
+                state = self._states[session_id] = _SummaryState(self.dim)
+                if len(self._states) > self.max_sessions:
+                    self._states.popitem(last=False)
+            else:
+                self._states.move_to_end(session_id)
+            return state
+
+    def summary(self, session_id):
+        """Current summary of a session ("" until its first update)."""
+        with self._lock:
+            state = self._states.get(session_id)
+            return " ".join(state.summary) if state is not None else ""
+
+    def seed(self, session_id, summary, upto):
+        """Start a session's state from a stored summary (one sentence per line) covering `upto` messages.
+
+        Only the summary sentences survive a restart, so they become the new
+        candidate pool and centroid. No-op if the session is already in memory.
+        """
+        if not session_id:
+            return None
+        sentences = [line for line in (summary or "").splitlines() if line.strip()]
+        with self._lock:
+            if session_id in self._states:
+                return None
+            state = self._states[session_id] = _SummaryState(self.dim)
+            if len(self._states) > self.max_sessions:
+                self._states.popitem(last=False)
+            state.upto = upto
+            state.summary = sentences
+            state.saved = "\n".join(sentences)
+        if not sentences:
+            return None
+        return self._executor.submit(self._seed, state, sentences)
+
+    def _seed(self, state, sentences):
+        vectors = np.asarray(self.encode(sentences, normalize_embeddings=True), dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        with self._lock:
+            state.centroid_sum = vectors.sum(axis=0)
+            state.count = len(vectors)
+            state.vectors = vectors
+            state.sentences = list(sentences)
+            state.order = [i - len(sentences) for i in range(len(sentences))]  # before any new message
+
+    def update(self, session_id, messages, end, offset=0, save=None, load=None):
+        """Fold new older messages into the summary in the background once past the threshold.
+
+        Positions up to `end` are the part of the history not kept verbatim;
+        only the slice added since the last update is read. `messages[0]` is
+        at position `offset` (a paged log may not hold the earliest ones);
+        `load(start, stop)` returns stored messages in [start, stop) that the
+        log does not hold, e.g. between a seeded summary and a reopened page.
+        Without it those are skipped. `save(summary, upto)` is called when
+        an update changed the summary, with one sentence per line. Returns
+        the Future, or None when there isn't enough new material yet.
+        """
+        if not session_id:
+            return None
+        state = self._state(session_id)
+        start = state.upto if load is not None else max(state.upto, offset)
+        if end - start < self.threshold:
+            return None
+        new_messages = messages[max(start, offset) - offset:max(end - offset, 0)]
+        gap = (start, min(offset, end)) if start < offset else None
+        state.upto = end
+        return self._executor.submit(self._update, state, start, new_messages, end, save, load, gap)
+
+    def _update(self, state, start, messages, end, save=None, load=None, gap=None):
+        if gap is not None:
+            messages = list(load(*gap) or []) + messages
+        sentences, order = [], []
+        for offset, message in enumerate(messages):
+            for sentence in split_sentences(message):
+                sentences.append(sentence)
+                order.append(start + offset)
+        if not sentences:
+            return
+        vectors = np.asarray(self.encode(sentences, normalize_embeddings=True), dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+        state.centroid_sum += vectors.sum(axis=0)
+        state.count += len(vectors)
+        pool_vectors = np.vstack([state.vectors, vectors])
+        pool_sentences = state.sentences + sentences
+        pool_order = state.order + order
+
+        centroid = state.centroid_sum / max(float(np.linalg.norm(state.centroid_sum)), 1e-12)
+        scores = pool_vectors @ centroid
+        ranked = np.argsort(-scores, kind="stable")
+        keep = ranked[:self.pool_size]
+
+        picked = []
+        for i in keep:
+            if len(picked) == self.max_sentences:
+                break
+            if picked and float(np.max(pool_vectors[picked] @ pool_vectors[i])) > 0.9:
+                continue  # near-duplicate of a sentence already in the summary
+            picked.append(int(i))
+        picked.sort(key=lambda i: (pool_order[i], i))
+
+        with self._lock:
+            state.vectors = pool_vectors[keep]
+            state.sentences = [pool_sentences[i] for i in keep]
+            state.order = [pool_order[i] for i in keep]
+            state.summary = [pool_sentences[i] for i in picked]
+        print(f"[DEBUG] Summary updated: {len(sentences)} new sentences, {state.count} total, {len(picked)} kept")
+        text = "\n".join(state.summary)
+        if save is not None and text != state.saved:  # unchanged: no write (the stored upto may lag behind)
+            save(text, end)
+            state.saved = text
+
+    def forget(self, session_id):
+        with self._lock:
+            self._states.pop(session_id, None)
@@ -1,5 +1,7 @@
 import gradio as gr
+from html import escape as html_escape
 from chatbot.chatbot_logic import Chatbot
+from chatbot.message_log import MessageLog
 
 def create_session_html(sessions):
     print("[DEBUG] create_session_html() with sessions=", sessions)
@@ -8,12 +10,13 @@ def create_session_html(sessions):
         return "<div class='session-list'></div>"
     
     html = "<div class='session-list'>"
-    for i, session in enumerate(sessions):
+    for session_id, name in sessions.items():
+        session_id = html_escape(session_id)
         html += f"""
         <div class="session-list">
-            <div class="session-item" data-index="0">
-                <div class="session-name">2025-02-28 15:08:16</div>
-                <div class="options" data-session-id="0">⁝</div>
+            <div class="session-item" data-session-id="{session_id}">
+                <div class="session-name">{html_escape(name)}</div>
+                <div class="options" data-session-id="{session_id}">⁝</div>
             </div>
             <!-- No modal here anymore -->
         </div>
@@ -46,7 +49,7 @@ def build_ui(demo, chatbot: Chatbot):
                 </h1>
             """)
             new_chat_btn = gr.Button("➕  New Chat", elem_classes=["new-chat-btn", "spaced-icon-btn"], interactive=False)
-            session_list = gr.State([])  
+            session_list = gr.State({})  # {session id: name}
             session_html = gr.HTML("<div class='session-list'></div>")
             session_select_callback = gr.Textbox(
                 elem_id="session-select-callback", visible=False, interactive=True
@@ -65,42 +68,41 @@ def build_ui(demo, chatbot: Chatbot):
                     elem_id="message-input", max_plain_text_length=8000, max_lines=8000
                 )
 
-            chat_history = gr.State([])
+            # Append-only MessageLog (see chatbot.message_log); the session is stored as it grows
+            chat_history = gr.State(None)
 
             def handle_message(user_input, history, session_list):
                 """Handle message input from user."""
                 user_text = str(user_input).strip() if not isinstance(user_input, dict) else user_input.get("text", "").strip()
+                if not isinstance(history, MessageLog):
+                    history = MessageLog(list(history or []))
 
                 if not user_text:
-                    return history, "", session_list, ""
-
-                # Ensure session creation and processing of user message
-                if len(history) == 0:
-                    chat_name = chatbot.generate_chat_name()
-                    session_list = list(session_list)
-                    if chat_name not in chatbot.chat_sessions:
-                        chatbot.chat_sessions[chat_name] = [{"role": "assistant", "content": "👋 Welcome to W3 BrainBot!"}]
-                        session_list.append(chat_name)
+                    return history.messages, "", history, session_list, ""
 
+                # The first message creates the stored session; list it by id
                 new_history, _ = chatbot.chatbot_response(user_text, history)
-                new_history.append({"role": "user", "content": user_text})
+                if history.session_id not in session_list:
+                    session_list = dict(session_list)
+                    session_list[history.session_id] = chatbot.chat_sessions.get_name(history.session_id) or history.session_id
 
-                if len(history) == 0:
-                    chatbot.chat_sessions[chat_name] = new_history  # Save first message
+                return new_history, "", history, session_list, create_session_html(session_list)
 
-                return new_history, "", session_list, ""
+            def new_chat(history, session_list):
+                new_messages, log, session_list = chatbot.start_new_chat(history, session_list)
+                return new_messages, log, session_list, create_session_html(session_list)
 
             message_input.submit(
                 handle_message,
                 inputs=[message_input, chat_history, session_list],
-                outputs=[chatbot_component, message_input, session_list, session_html]
+                outputs=[chatbot_component, message_input, chat_history, session_list, session_html]
             ).then(
                 lambda: gr.update(interactive=True), outputs=[new_chat_btn]
             )
 
             # New Chat Button
             new_chat_btn.click(
-                chatbot.start_new_chat,
+                new_chat,
                 inputs=[chat_history, session_list],
                 outputs=[chatbot_component, chat_history, session_list, session_html]
             ).then(
@@ -109,6 +111,7 @@ def build_ui(demo, chatbot: Chatbot):
 
             # Loading past session
             session_select_callback.input(
-                chatbot.load_chat, inputs=[session_select_callback, session_list], outputs=[chatbot_component]
+                chatbot.load_chat, inputs=[session_select_callback],
+                outputs=[chatbot_component, chat_history]
             )
 
@@ -5,12 +5,12 @@ document.addEventListener("click", function(e) {
   
     // Handle session item click to load chat
     if (item && !optionsBtn) {
-      console.log("[DEBUG] Clicked .session-item with index:", item.dataset.index);
+      console.log("[DEBUG] Clicked .session-item with id:", item.dataset.sessionId);
   
       // We select the actual <textarea> inside #session-select-callback
       var hiddenBox = document.querySelector("#session-select-callback textarea");
       if (hiddenBox) {
-        hiddenBox.value = item.dataset.index;
+        hiddenBox.value = item.dataset.sessionId;
         console.log("[DEBUG] Setting hidden callback value:", hiddenBox.value);
         // Dispatch 'input' event to match .input(...) in Python
         hiddenBox.dispatchEvent(new Event("input", { bubbles: true }));
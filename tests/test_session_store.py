@@ -0,0 +1,149 @@
+"""Concurrency checks for the session store: handlers for many owners interleaving on shared shards.
+
+    python -m pytest tests/test_session_store.py
+"""
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from modularization.chatbot.session_manager import SessionManager, ShardedSessionStore
+
+THREADS = 16
+TURNS = 200
+SHARDS = 4  # fewer shards than owners, so several owners share each shard's lock
+
+
+def run_threads(target, count):
+    """Start `count` threads on target(i) together; re-raise the first failure."""
+    barrier = threading.Barrier(count)
+    errors = []
+
+    def worker(i):
+        barrier.wait()
+        try:
+            target(i)
+        except BaseException as exc:
+            errors.append(exc)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+
+def turn(owner, number):
+    return [
+        {"role": "user", "content": f"{owner} question {number}"},
+        {"role": "assistant", "content": f"{owner} answer {number}"},
+    ]
+
+
+class ShardedSessionStoreConcurrencyTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "sessions.sqlite3")
+        # Small batches, so commits land while other threads are mid-write
+        self.store = ShardedSessionStore(self.path, shards=SHARDS, commit_every=7, commit_interval=0.01)
+
+    def tearDown(self):
+        self.store.flush()
+        for shard in self.store.shards:
+            shard.conn.close()
+        shutil.rmtree(self.tmp)
+
+    def reopen(self):
+        self.store.flush()
+        return ShardedSessionStore(self.path, shards=SHARDS)
+
+    def test_owners_only_see_their_own_sessions(self):
+        owners = [f"user-{i}" for i in range(THREADS)]
+        created = {}
+
+        def handler(i):
+            sessions = self.store.for_owner(owners[i])
+            ids = [sessions.create_session(f"{owners[i]} chat {n}") for n in range(3)]
+            created[owners[i]] = ids
+            for number in range(TURNS // 10):
+                for session_id in ids:
+                    sessions.append_messages(session_id, turn(owners[i], number))
+                # Every read during the run must already be scoped to this owner
+                self.assertEqual(sessions.list_sessions(), ids)
+
+        run_threads(handler, THREADS)
+
+        for owner in owners:
+            sessions = self.store.for_owner(owner)
+            self.assertEqual(sessions.list_sessions(), created[owner])
+            for session_id in created[owner]:
+                contents = {m["content"] for m in sessions.get_session(session_id)}
+                self.assertTrue(all(content.startswith(owner + " ") for content in contents))
+
+        # Nothing of another owner's can be read, renamed or deleted, even on the same shard
+        intruder = self.store.for_owner(owners[0])
+        for owner in owners[1:]:
+            for session_id in created[owner]:
+                self.assertIsNone(intruder.get_session(session_id))
+                self.assertIsNone(intruder.get_page(session_id))
+                self.assertFalse(intruder.rename_session(session_id, "taken"))
+                self.assertFalse(intruder.delete_session(session_id))
+                self.assertEqual(self.store.for_owner(owner).get_name(session_id), f"{owner} chat {created[owner].index(session_id)}")
+
+    def test_interleaved_appends_lose_no_writes(self):
+        # Pairs of threads share an owner and a session, as two tabs of one browser would
+        owners = [f"user-{i // 2}" for i in range(THREADS)]
+        session_ids = {owner: self.store.for_owner(owner).create_session(owner) for owner in set(owners)}
+
+        def handler(i):
+            sessions = self.store.for_owner(owners[i])
+            for number in range(TURNS):
+                sessions.append_messages(session_ids[owners[i]], turn(f"{owners[i]}/{i}", number))
+
+        run_threads(handler, THREADS)
+
+        for store in (self.store, self.reopen()):
+            for owner, session_id in session_ids.items():
+                sessions = store.for_owner(owner)
+                messages = sessions.get_session(session_id)
+                self.assertEqual(len(messages), 2 * 2 * TURNS)
+                self.assertEqual(sessions.get_user_turns(session_id), 2 * TURNS)
+                # Each writer's turns arrive whole and in order, whatever the interleaving
+                for i in (j for j in range(THREADS) if owners[j] == owner):
+                    prefix = f"{owner}/{i} "
+                    own = [m["content"] for m in messages if m["content"].startswith(prefix)]
+                    self.assertEqual(own, [m["content"] for n in range(TURNS) for m in turn(f"{owner}/{i}", n)])
+                page, start = sessions.get_page(session_id, limit=10)
+                self.assertEqual((page, start), (messages[-10:], len(messages) - 10))
+
+
+class SessionManagerConcurrencyTest(unittest.TestCase):
+    def test_dict_style_writers_share_one_store(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, "sessions.sqlite3")
+            store = SessionManager(path, commit_every=5, commit_interval=0.01)
+
+            def handler(i):
+                history = []
+                for number in range(TURNS // 4):
+                    history += turn(f"chat-{i}", number)
+                    store[f"chat-{i}"] = list(history)
+
+            run_threads(handler, THREADS)
+            store.flush()
+            reopened = SessionManager(path)
+            self.assertEqual(len(reopened), THREADS)
+            for i in range(THREADS):
+                self.assertEqual(len(reopened[f"chat-{i}"]), 2 * (TURNS // 4))
+            store.conn.close()
+            reopened.conn.close()
+        finally:
+            shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    unittest.main()
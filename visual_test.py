@@ -1,11 +1,11 @@
 import gradio as gr
 import datetime
-from sentence_transformers import SentenceTransformer
 import base64
+from modularization.chatbot.session_manager import SessionManager
 
 # === Work from here============
-# Global storage for saved chat sessions
-chat_sessions = {}
+# Saved chat sessions (SQLite, survives restarts; same dict-style access as before)
+chat_sessions = SessionManager()
 
 with open("W3_Nobg.png", "rb") as img_file:
     base64_str = base64.b64encode(img_file.read()).decode()
@@ -96,6 +96,14 @@ def load_chat(selected_index_str, session_list):
     
     return []  # Return empty if invalid selection
 
+# ---------------------------------------------
+# Restore the sidebar from the saved sessions
+# ---------------------------------------------
+def restore_sessions():
+    session_list = list(chat_sessions)
+    print("[DEBUG] restore_sessions() restored", len(session_list), "saved sessions")
+    return [{"role": "assistant", "content": "👋 Welcome to W3 BrainBot!"}], session_list, create_session_html(session_list)
+
 # ---------------------------------------------
 # Build HTML for sessions (sidebar list)
 # ---------------------------------------------
@@ -312,8 +320,8 @@ with gr.Blocks(
 
             # -- On initial load, show a welcome
             demo.load(
-                lambda: [{"role": "assistant", "content": "👋 Welcome to W3 BrainBot!"}],
-                outputs=[chatbot]
+                restore_sessions,
+                outputs=[chatbot, session_list, session_html]
             ).then(
                 lambda x: x,
                 inputs=[chatbot],